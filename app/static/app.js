@@ -0,0 +1,632 @@
+let currentSessionId = null;
+let ws = null;
+// 断线重连：指数退避加随机抖动，只在有进行中的任务时重连
+let wsAttempt = 0;
+let wsTimer = null;
+let generationActive = false;
+const regeneratingStages = new Set();
+// 阶段定义、分组、顺序和依赖由服务端以 JSON 数据块嵌入页面
+const STAGE_DATA = JSON.parse(document.getElementById('stage-data').textContent);
+const STAGE_DEFINITIONS = STAGE_DATA.definitions;
+const STAGE_GROUPS = STAGE_DATA.groups;
+const STAGE_ORDER = STAGE_DATA.order;
+const STAGE_DEPENDENCIES = STAGE_DATA.dependencies;
+let stageResults = {};
+const utf8Decoder = new TextDecoder();
+
+// 收到的消息先排队，每个动画帧统一处理一次，减少连续推送时的重复布局
+let pendingMessages = [];
+let flushFrame = 0;
+// 本帧是否有阶段更新需要刷新总进度，以及进度条上显示的阶段
+let progressDirty = false;
+let progressLabel = '';
+
+// 已有结果的阶段数，以及各阶段当前状态（避免每次更新都扫描页面）
+let completedStages = 0;
+let stageStatuses = {};
+
+// 阶段成功位图：第 i 位表示 STAGE_ORDER[i] 已成功；依赖检查变成一次位运算
+let successMask = 0;
+const STAGE_BIT = Object.fromEntries(STAGE_ORDER.map((stageId, i) => [stageId, 1 << i]));
+const DEPENDENCY_MASK = Object.fromEntries(STAGE_ORDER.map(stageId => [
+    stageId,
+    (STAGE_DEPENDENCIES[stageId] || []).reduce((mask, depId) => mask | STAGE_BIT[depId], 0)
+]));
+// 只对已实现的阶段允许重新生成
+const IMPLEMENTED_MASK = ['1_0', '2_1', '2_2', '2_3'].reduce((mask, stageId) => mask | STAGE_BIT[stageId], 0);
+
+// 各阶段行内常用元素：stageId -> { status, results, regenerate }，渲染时建立
+let stageNodes = {};
+// 状态指示器可能带的状态类
+const STATUS_CLASSES = ['pending', 'running', 'success', 'failed', 'skipped'].map(s => `status-${s}`);
+let progressBar = null;
+let progressText = null;
+// 页面里声明的 DOM 模板（分组、阶段行、结果卡片），克隆后只填文本
+let groupTpl = null;
+let rowTpl = null;
+let cardTpl = null;
+// 提示消息元素及其自动隐藏计时器
+let toastEl = null;
+let toastTimer = null;
+
+document.addEventListener('DOMContentLoaded', function() {
+    progressBar = document.getElementById('progressBar');
+    progressText = document.getElementById('progressText');
+    groupTpl = document.getElementById('tmpl-stage-group').content;
+    rowTpl = document.getElementById('tmpl-stage-row').content;
+    cardTpl = document.getElementById('tmpl-result-card').content;
+    toastEl = document.getElementById('toast');
+    document.getElementById('generateBtn').addEventListener('click', startGeneration);
+
+    // 流程区域内的交互统一委托给容器，卡片和按钮本身不绑定处理函数
+    const pipelineContainer = document.getElementById('pipelineContainer');
+    pipelineContainer.addEventListener('click', event => {
+        const target = event.target.closest('[data-action]');
+        if (!target || target.disabled) return;
+        if (target.dataset.action === 'regenerate') {
+            regenerateStage(target.dataset.stage);
+        }
+    });
+    // 图像加载失败事件不冒泡，在捕获阶段处理
+    pipelineContainer.addEventListener('error', event => {
+        if (event.target.tagName === 'IMG') {
+            event.target.parentElement.innerHTML = '<div class="image-error">加载失败</div>';
+        }
+    }, true);
+
+    renderInitialPipeline();
+});
+
+// 网络恢复时不必等完退避间隔，有待重连的连接就立即重连
+window.addEventListener('online', () => {
+    if (wsTimer) {
+        connectWebSocket();
+    }
+});
+
+function renderInitialPipeline() {
+    completedStages = 0;
+    stageStatuses = {};
+    successMask = 0;
+    stageResults = {};
+    if (cardObserver) {
+        cardObserver.disconnect();
+    }
+
+    // 流程行只建一次，之后每轮生成复用并重置
+    if (Object.keys(stageNodes).length > 0) {
+        resetPipeline();
+        return;
+    }
+
+    const container = document.getElementById('pipelineContainer');
+    for (const group of Object.values(STAGE_GROUPS)) {
+        const groupDiv = groupTpl.cloneNode(true).firstElementChild;
+        groupDiv.querySelector('.group-icon').textContent = group.icon;
+        groupDiv.querySelector('.group-name').textContent = group.name;
+
+        // 阶段列表
+        const stagesDiv = groupDiv.querySelector('.group-stages');
+        for (const stageId of group.stages) {
+            const stageDef = STAGE_DEFINITIONS[stageId];
+            stagesDiv.appendChild(createStageRow(stageId, stageDef));
+        }
+
+        container.appendChild(groupDiv);
+    }
+}
+
+function resetPipeline() {
+    for (const nodes of Object.values(stageNodes)) {
+        nodes.results.querySelectorAll('.result-card').forEach(releaseCard);
+        nodes.results.replaceChildren(el('div', 'empty-state', '等待中...'));
+        const classList = nodes.status.classList;
+        classList.remove(...STATUS_CLASSES);
+        classList.add('status-pending');
+        nodes.regenerate.disabled = true;
+    }
+}
+
+function createStageRow(stageId, stageDef) {
+    const row = rowTpl.cloneNode(true).firstElementChild;
+    row.id = `stage-row-${stageId}`;
+    row.querySelector('.stage-info-icon').textContent = stageDef.icon;
+    row.querySelector('.stage-info-sub').textContent = stageDef.sub_stage;
+    row.querySelector('.stage-info-name').textContent = stageDef.short_name;
+    row.querySelector('.stage-info-desc').textContent = stageDef.description;
+
+    const regenerate = row.querySelector('.stage-regenerate-btn');
+    regenerate.id = `regenerate-${stageId}`;
+    regenerate.dataset.stage = stageId;
+    const status = row.querySelector('.stage-status-indicator');
+    status.id = `status-${stageId}`;
+    const results = row.querySelector('.stage-results');
+    results.id = `results-${stageId}`;
+
+    stageNodes[stageId] = { status, results, regenerate };
+
+    return row;
+}
+
+async function startGeneration() {
+    const text = document.getElementById('inputText').value.trim();
+    if (!text) {
+        showToast('请输入故事内容', 'info');
+        return;
+    }
+
+    const btn = document.getElementById('generateBtn');
+    btn.disabled = true;
+    btn.textContent = '⏳ 生成中...';
+
+    try {
+        const res = await fetch('/api/generate', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                text: text,
+                style: document.getElementById('style').value,
+                resolution: document.getElementById('resolution').value
+            })
+        });
+
+        const data = await res.json();
+        if (data.error || !res.ok) {
+            showToast('启动失败: ' + (data.error || data.detail));
+            btn.disabled = false;
+            btn.textContent = '🚀 开始生成';
+            return;
+        }
+
+        currentSessionId = data.session_id;
+        generationActive = true;
+        renderInitialPipeline();
+        document.getElementById('progressSection').classList.add('active');
+        document.getElementById('flowSection').classList.add('active');
+        connectWebSocket();
+
+    } catch (e) {
+        showToast('请求失败: ' + e.message);
+        btn.disabled = false;
+        btn.textContent = '🚀 开始生成';
+    }
+}
+
+function connectWebSocket() {
+    clearTimeout(wsTimer);
+    wsTimer = null;
+    if (ws) {
+        // 换用新连接，旧连接关闭时不再触发重连
+        ws.onclose = null;
+        ws.close();
+    }
+
+    const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+    const wsUrl = `${protocol}//${window.location.host}/ws`;
+
+    ws = new WebSocket(wsUrl);
+    // 服务端以二进制帧发送 UTF-8 JSON
+    ws.binaryType = 'arraybuffer';
+
+    ws.onopen = () => {
+        console.log('WebSocket connected');
+        wsAttempt = 0;
+        if (currentSessionId) {
+            ws.send(JSON.stringify({
+                type: 'subscribe',
+                session_id: currentSessionId
+            }));
+        }
+    };
+
+    ws.onmessage = (event) => {
+        const text = typeof event.data === 'string' ? event.data : utf8Decoder.decode(event.data);
+        pendingMessages.push(JSON.parse(text));
+        if (!flushFrame) {
+            flushFrame = requestAnimationFrame(flushMessages);
+        }
+    };
+
+    ws.onclose = () => {
+        console.log('WebSocket disconnected');
+        ws = null;
+        if (currentSessionId && (generationActive || regeneratingStages.size > 0) && !wsTimer) {
+            // 抖动与间隔成比例，服务重启后各页面的重连时间分散开
+            const delay = Math.min(30000, 500 * 2 ** wsAttempt) * (0.5 + Math.random());
+            wsAttempt++;
+            wsTimer = setTimeout(() => {
+                wsTimer = null;
+                connectWebSocket();
+            }, delay);
+        }
+    };
+
+    ws.onerror = (error) => {
+        console.error('WebSocket error:', error);
+    };
+}
+
+function flushMessages() {
+    flushFrame = 0;
+    const messages = pendingMessages;
+    pendingMessages = [];
+    messages.forEach(handleWebSocketMessage);
+
+    // 一帧内的所有阶段更新处理完后，只更新一次进度条
+    if (progressDirty) {
+        progressDirty = false;
+        const progress = Math.min(completedStages / STAGE_ORDER.length, 1);
+        updateProgress(progress, progressLabel);
+    }
+}
+
+function handleWebSocketMessage(data) {
+    console.log('收到消息:', data);
+
+    if (data.type === 'batch') {
+        // 服务端把发送队列中积压的多条消息合并成了一帧
+        data.events.forEach(handleWebSocketMessage);
+    } else if (data.type === 'progress_batch') {
+        // 合并推送的进度更新，逐条按 stage_update 处理
+        data.updates.forEach(update => handleWebSocketMessage({
+            type: 'stage_update',
+            is_regeneration: data.is_regeneration,
+            ...update
+        }));
+    } else if (data.type === 'stages_batch_update') {
+        // 阶段结果批量推送，最后处理附带的完成/错误消息
+        data.updates.forEach(update => handleWebSocketMessage({
+            type: 'stage_update',
+            ...update
+        }));
+        if (data.final) {
+            handleWebSocketMessage(data.final);
+        }
+    } else if (data.type === 'stage_update') {
+        updateStageStatus(data.stage_id, data.status);
+        if (data.is_regeneration && data.status !== 'running') {
+            regeneratingStages.delete(data.stage_id);
+        }
+
+        if (data.status === 'success' && data.output && !isLatestResult(data.stage_id, data.output)) {
+            addResultCard(data.stage_id, data.output);
+        }
+
+        // 总进度在本帧的消息处理完后统一更新
+        const stageDef = STAGE_DEFINITIONS[data.stage_id];
+        const isRegeneration = data.is_regeneration ? '重新' : '';
+        progressLabel = `${isRegeneration}${stageDef ? stageDef.short_name : '处理中'}`;
+        progressDirty = true;
+
+    } else if (data.type === 'session_init') {
+        // 订阅（包括断线重连）后服务端先发来会话的完整状态，补上断开期间错过的消息
+        applySessionSnapshot(data.nodes);
+    } else if (data.type === 'complete') {
+        progressDirty = false;
+        generationComplete(data.output_path);
+    } else if (data.type === 'error') {
+        generationError(data.error);
+    }
+}
+
+// 按会话快照重建各阶段的状态和结果；所有阶段都已结束时收尾本轮生成
+function applySessionSnapshot(nodes) {
+    let terminal = true;
+    let failedNode = null;
+    for (const [stageId, node] of Object.entries(nodes)) {
+        updateStageStatus(stageId, node.status);
+        if (node.status === 'success' && node.output && !isLatestResult(stageId, node.output)) {
+            addResultCard(stageId, node.output);
+        }
+        if (node.status === 'pending' || node.status === 'running') {
+            terminal = false;
+        } else {
+            regeneratingStages.delete(stageId);
+            if (node.status === 'failed' && !failedNode) {
+                failedNode = node;
+            }
+        }
+    }
+    progressLabel = '同步状态';
+    progressDirty = true;
+
+    if (terminal && generationActive) {
+        if (failedNode) {
+            generationError(failedNode.error);
+        } else {
+            progressDirty = false;
+            generationComplete(null);
+        }
+    }
+}
+
+// 输出是否与该阶段最近一张结果卡片相同（快照和后续推送可能带着同一份结果）
+function isLatestResult(stageId, output) {
+    const results = stageResults[stageId];
+    if (!results || results.length === 0) return false;
+    return JSON.stringify(results[results.length - 1].output) === JSON.stringify(output);
+}
+
+function updateStageStatus(stageId, status) {
+    const previous = stageStatuses[stageId];
+    stageStatuses[stageId] = status;
+    const bit = STAGE_BIT[stageId] || 0;
+    successMask = status === 'success' ? successMask | bit : successMask & ~bit;
+    const nodes = stageNodes[stageId];
+    if (!nodes) return;
+
+    // 只在状态变化时切换状态类（进度推送会反复报告 running）
+    if (previous !== status) {
+        const classList = nodes.status.classList;
+        classList.remove(...STATUS_CLASSES);
+        classList.add(`status-${status}`);
+    }
+
+    // 更新重新生成按钮状态：依赖全部成功且阶段已实现
+    const depMask = DEPENDENCY_MASK[stageId] || 0;
+    const canRegenerate = (successMask & depMask) === depMask && (IMPLEMENTED_MASK & bit) !== 0;
+    nodes.regenerate.disabled = !canRegenerate || status === 'running';
+}
+
+async function regenerateStage(stageId) {
+    if (!currentSessionId) {
+        showToast('请先生成完整流程', 'info');
+        return;
+    }
+
+    const regenerateBtn = stageNodes[stageId].regenerate;
+    regenerateBtn.disabled = true;
+    regenerateBtn.textContent = '⏳ 生成中...';
+
+    updateStageStatus(stageId, 'running');
+    regeneratingStages.add(stageId);
+    if (!ws) {
+        connectWebSocket();
+    }
+
+    try {
+        const res = await fetch('/api/regenerate_stage', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                session_id: currentSessionId,
+                stage_id: stageId
+            })
+        });
+
+        const data = await res.json();
+        if (data.error) {
+            showToast('重新生成失败: ' + data.error);
+            regeneratingStages.delete(stageId);
+            updateStageStatus(stageId, 'failed');
+        }
+    } catch (e) {
+        showToast('请求失败: ' + e.message);
+        regeneratingStages.delete(stageId);
+        updateStageStatus(stageId, 'failed');
+    } finally {
+        regenerateBtn.textContent = '🔄 重新生成';
+    }
+}
+
+// 结果卡片上的时间（时:分:秒）；同一秒内复用上次格式化的字符串
+let lastTimeSecond = -1;
+let lastTimeStr = '';
+
+function pad2(n) {
+    return n < 10 ? '0' + n : '' + n;
+}
+
+function formatTime() {
+    const ms = Date.now();
+    const second = Math.floor(ms / 1000);
+    if (second !== lastTimeSecond) {
+        const now = new Date(ms);
+        lastTimeSecond = second;
+        lastTimeStr = `${pad2(now.getHours())}:${pad2(now.getMinutes())}:${pad2(now.getSeconds())}`;
+    }
+    return lastTimeStr;
+}
+
+function addResultCard(stageId, output) {
+    const nodes = stageNodes[stageId];
+    if (!nodes) return;
+    const resultsContainer = nodes.results;
+
+    const emptyState = resultsContainer.querySelector('.empty-state');
+    if (emptyState) {
+        emptyState.remove();
+        completedStages++;
+    }
+
+    if (!stageResults[stageId]) {
+        stageResults[stageId] = [];
+    }
+    const resultIndex = stageResults[stageId].length;
+    stageResults[stageId].push({ output, time: formatTime() });
+
+    const card = createResultCard(stageId, resultIndex);
+    resultsContainer.appendChild(card);
+    resultsContainer.scrollLeft = resultsContainer.scrollWidth;
+}
+
+// 结果卡片虚拟化：卡片离开可见区域后清空内容（保留占位尺寸），重新进入时按 stageResults 重建，
+// 历史结果再多，页面中有内容的卡片和加载的图像也只与可见区域相关
+const cardObserver = 'IntersectionObserver' in window
+    ? new IntersectionObserver(entries => {
+        entries.forEach(entry => {
+            const card = entry.target;
+            if (entry.isIntersecting && !card.dataset.mounted) {
+                mountResultCard(card);
+            } else if (!entry.isIntersecting && card.dataset.mounted) {
+                unmountResultCard(card);
+            }
+        });
+    })
+    : null;
+
+// 重置流程时回收的结果卡片元素，创建卡片时优先复用
+const cardPool = [];
+
+function releaseCard(card) {
+    card.remove();
+    card.replaceChildren();
+    card.removeAttribute('style');
+    delete card.dataset.mounted;
+    cardPool.push(card);
+}
+
+function createResultCard(stageId, index) {
+    const card = cardPool.pop() || document.createElement('div');
+    card.className = 'result-card';
+    card.dataset.stage = stageId;
+    card.dataset.index = index;
+    mountResultCard(card);
+    if (cardObserver) {
+        cardObserver.observe(card);
+    }
+    return card;
+}
+
+function unmountResultCard(card) {
+    card.style.height = `${card.offsetHeight}px`;
+    card.replaceChildren();
+    delete card.dataset.mounted;
+}
+
+// 结果内容用 DOM 节点拼装，输出里的文本一律走 textContent
+function el(tag, className, text) {
+    const node = document.createElement(tag);
+    if (className) node.className = className;
+    if (text !== undefined) node.textContent = text;
+    return node;
+}
+
+// 一行“标签: 值”，可以连续传入多组标签和值，用“ | ”分隔
+function fieldLine(className, ...pairs) {
+    const line = el('div', className);
+    for (let i = 0; i < pairs.length; i += 2) {
+        if (i > 0) line.append(' | ');
+        line.append(el('strong', null, `${pairs[i]}:`), ` ${pairs[i + 1]}`);
+    }
+    return line;
+}
+
+function renderResultContent(stageId, output) {
+    const text = el('div', 'result-text');
+
+    switch(stageId) {
+        case '1_0':
+            text.append(
+                fieldLine(null, '输入文本', output.input_text || ''),
+                fieldLine('gap-top', '风格', output.style || 'anime'),
+                fieldLine(null, '分辨率', output.resolution || '1080p')
+            );
+            return [text];
+
+        case '2_1': {
+            text.append(
+                fieldLine('gap-bottom', '标题', output.title || '未命名'),
+                fieldLine('gap-bottom', '类型', output.story_type || '未知'),
+                fieldLine('gap-bottom', '主题', output.theme || '未知'),
+                fieldLine('gap-bottom-lg', '场景数', output.scene_count || 0, '角色数', output.character_count || 0)
+            );
+            if (!output.scenes || output.scenes.length === 0) {
+                return [text];
+            }
+            const list = el('div', 'scene-list');
+            for (const scene of output.scenes.slice(0, 3)) {
+                const item = el('div', 'scene-item');
+                item.append(
+                    el('div', 'scene-title', `场景 ${scene.order + 1}: ${scene.title}`),
+                    el('div', 'scene-desc', `${(scene.description || '').substring(0, 80)}...`)
+                );
+                list.appendChild(item);
+            }
+            if (output.scenes.length > 3) {
+                list.appendChild(el('div', 'result-more', `...还有 ${output.scenes.length - 3} 个场景`));
+            }
+            return [text, list];
+        }
+
+        case '2_2':
+            text.append(fieldLine(null, '已准备场景描述', `${output.description_count || 0} 个场景`));
+            return [text];
+
+        case '2_3': {
+            if (!output.image_paths || output.image_paths.length === 0) {
+                text.textContent = '无图像生成';
+                return [text];
+            }
+            const grid = el('div', 'image-grid');
+            output.image_paths.slice(0, 4).forEach((path, idx) => {
+                const fileName = path.split(/[\/]/).pop();
+                const img = el('img');
+                img.src = '/temp/' + fileName + (output.version ? '?v=' + output.version : '');
+                img.alt = `场景 ${idx + 1}`;
+                img.loading = 'lazy';
+                img.decoding = 'async';
+                const item = el('div', 'image-item');
+                item.appendChild(img);
+                grid.appendChild(item);
+            });
+            if (output.image_paths.length > 4) {
+                grid.appendChild(el('div', 'result-more', `...还有 ${output.image_paths.length - 4} 张图像`));
+            }
+            return [grid];
+        }
+
+        default:
+            text.textContent = '该阶段尚未实现';
+            return [text];
+    }
+}
+
+function mountResultCard(card) {
+    const stageId = card.dataset.stage;
+    const index = Number(card.dataset.index);
+    const { output, time: timeStr } = stageResults[stageId][index];
+
+    const body = cardTpl.cloneNode(true);
+    body.querySelector('.result-title').textContent = `#${index + 1}`;
+    body.querySelector('.result-time').textContent = timeStr;
+    body.querySelector('.result-content').append(...renderResultContent(stageId, output));
+    card.replaceChildren(body);
+    card.style.height = '';
+    card.dataset.mounted = '1';
+}
+
+function updateProgress(progress, message) {
+    progressBar.style.width = `${progress * 100}%`;
+    progressText.textContent = `${message} (${Math.round(progress * 100)}%)`;
+}
+
+function stopReconnecting() {
+    generationActive = false;
+    clearTimeout(wsTimer);
+    wsTimer = null;
+}
+
+// 非阻塞提示：alert 会挂起脚本，期间 WebSocket 消息无法处理
+function showToast(message, kind = 'error') {
+    toastEl.textContent = message;
+    toastEl.className = `toast toast-${kind} show`;
+    clearTimeout(toastTimer);
+    toastTimer = setTimeout(() => toastEl.classList.remove('show'), 4000);
+}
+
+function generationComplete(outputPath) {
+    stopReconnecting();
+    const btn = document.getElementById('generateBtn');
+    btn.disabled = false;
+    btn.textContent = '🚀 开始生成';
+    updateProgress(1, '生成完成！');
+}
+
+function generationError(error) {
+    stopReconnecting();
+    const btn = document.getElementById('generateBtn');
+    btn.disabled = false;
+    btn.textContent = '🚀 开始生成';
+    showToast('生成失败: ' + error);
+}
@@ -10,18 +10,63 @@ FrameLeap Web界面
 
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable
+from urllib.parse import quote
 from dataclasses import dataclass, field
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
+import functools
+import gzip
+import os
+import re
+import threading
+import time
 import uuid
 import asyncio
+import hashlib
 import json
+import logging
 
-from fastapi import WebSocket, WebSocketDisconnect, HTTPException, BackgroundTasks
+from fastapi import WebSocket, WebSocketDisconnect, HTTPException, BackgroundTasks, Request
 from fastapi import FastAPI
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response
 from pydantic import BaseModel
 
+from app.config import config
+from app.generator import Generator
+from app.models import ScriptData, AudioData, GenerationResult
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def _json_default(obj: Any) -> Any:
+    """标准库json的兜底转换，与orjson对枚举和时间的原生处理保持一致"""
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _dumps(obj: Any) -> bytes:
+    """序列化为JSON字节（优先使用orjson）
+
+    orjson 默认只接受字符串键，这里开启 OPT_NON_STR_KEYS，
+    与标准库一样把整数等键转成字符串
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        obj, ensure_ascii=False, separators=(",", ":"), default=_json_default
+    ).encode("utf-8")
+
 
 class StageStatus(str, Enum):
     """阶段状态"""
@@ -167,9 +212,28 @@ STAGE_GROUPS = {
     },
 }
 
+# 阶段名称 -> 阶段ID（生成器进度回调按名称上报，完整名称和简称都可识别）
+_STAGE_NAME_TO_ID = {
+    name: stage_id
+    for stage_id, stage_def in STAGE_DEFINITIONS.items()
+    for name in (stage_def["name"], stage_def["short_name"])
+}
+# 生成器上报时使用的其它名称
+_STAGE_NAME_TO_ID["场景描述生成"] = "2_2"
+
+# 阶段定义不会变化，序列化一次供接口响应直接拼接
+_STAGE_DEFINITIONS_JSON = _dumps(STAGE_DEFINITIONS)
+
 # 阶段执行顺序
 STAGE_ORDER = ["1_0", "2_1", "2_2", "2_3", "2_4", "3_1", "3_2", "4_0"]
 
+# session_init 消息中固定不变的字段（阶段定义、分组、顺序），同样只序列化一次
+_SESSION_INIT_STATIC_JSON = (
+    b'"stages":' + _STAGE_DEFINITIONS_JSON
+    + b',"groups":' + _dumps(STAGE_GROUPS)
+    + b',"order":' + _dumps(STAGE_ORDER)
+)
+
 # 阶段依赖关系（哪些阶段需要前置阶段完成）
 STAGE_DEPENDENCIES = {
     "1_0": [],
@@ -183,7 +247,7 @@ STAGE_DEPENDENCIES = {
 }
 
 
-@dataclass
+@dataclass(slots=True)
 class StageNode:
     """阶段节点"""
     id: str = field(default_factory=lambda: str(uuid.uuid4()))
@@ -195,16 +259,42 @@ class StageNode:
     error_message: Optional[str] = None
     output: Optional[Dict[str, Any]] = None
     progress: float = 0.0  # 进度 0-1
+    # 单调时钟记录的开始时间和耗时：耗时不受系统时间调整影响
+    _start_mono: Optional[float] = field(default=None, repr=False, compare=False)
+    _duration: Optional[float] = field(default=None, repr=False, compare=False)
 
     @property
     def duration(self) -> Optional[float]:
         """耗时（秒）"""
-        if self.start_time and self.end_time:
-            return (self.end_time - self.start_time).total_seconds()
-        return None
-
-
-@dataclass
+        return self._duration
+
+    def mark_started(self):
+        """记录开始时间"""
+        self.start_time = datetime.now()
+        self._start_mono = time.monotonic()
+
+    def mark_finished(self, end_time: datetime, end_mono: float):
+        """记录结束时间并计算耗时（未记录开始时间时视为瞬间完成）
+
+        Args:
+            end_time: 结束的墙钟时间（用于展示）
+            end_mono: 结束的单调时钟时间（用于计算耗时）
+        """
+        self.end_time = end_time
+        if self.start_time is None:
+            self.start_time = end_time
+            self._start_mono = end_mono
+        self._duration = end_mono - self._start_mono
+
+    def reset_timing(self):
+        """清除开始/结束时间（重新生成前调用）"""
+        self.start_time = None
+        self.end_time = None
+        self._start_mono = None
+        self._duration = None
+
+
+@dataclass(slots=True)
 class GenerationSession:
     """生成会话"""
     id: str = field(default_factory=lambda: str(uuid.uuid4()))
@@ -213,6 +303,20 @@ class GenerationSession:
     resolution: str = "1080p"
     create_time: datetime = field(default_factory=datetime.now)
     nodes: Dict[str, StageNode] = field(default_factory=dict)  # stage_id -> StageNode
+    # 会话结束后详情响应不再变化，缓存序列化结果及其ETag
+    _frozen_response: Optional[bytes] = field(default=None, repr=False, compare=False)
+    _etag: Optional[str] = field(default=None, repr=False, compare=False)
+    # 序列化好的 session_init 消息，订阅者共用，阶段状态变化时清除
+    _init_snapshot: Optional[bytes] = field(default=None, repr=False, compare=False)
+    # 会话的进度中继，有生成任务运行时存在（见 acquire_relay / release_relay）
+    _relay: Optional["ProgressRelay"] = field(default=None, repr=False, compare=False)
+    # 创建时间的ISO字符串，创建后不变，会话列表和详情直接使用
+    _create_time_iso: str = field(default="", init=False, repr=False, compare=False)
+    # 整体进度缓存，阶段状态变化时清除
+    _progress: Optional[float] = field(default=None, repr=False, compare=False)
+
+    def __post_init__(self):
+        self._create_time_iso = self.create_time.isoformat()
 
     def get_node(self, stage_id: str) -> Optional[StageNode]:
         """获取阶段节点"""
@@ -223,16 +327,31 @@ class GenerationSession:
         self.nodes[stage_id] = node
 
     def get_progress(self) -> float:
-        """获取整体进度"""
-        if not self.nodes:
-            return 0.0
-        total = len(STAGE_DEFINITIONS)
-        completed = sum(1 for n in self.nodes.values() if n.status == StageStatus.SUCCESS)
-        return completed / total
+        """获取整体进度（缓存到下次阶段状态变化）"""
+        if self._progress is None:
+            if not self.nodes:
+                return 0.0
+            completed = sum(1 for n in self.nodes.values() if n.status == StageStatus.SUCCESS)
+            self._progress = completed / len(STAGE_DEFINITIONS)
+        return self._progress
+
+    def is_terminal(self) -> bool:
+        """所有阶段均已结束（没有等待中或运行中的阶段）"""
+        return all(
+            n.status not in (StageStatus.PENDING, StageStatus.RUNNING)
+            for n in self.nodes.values()
+        )
+
+
+# 全局存储（按创建顺序）
+_sessions: OrderedDict[str, GenerationSession] = OrderedDict()
 
+# 内存中最多保留的会话数，超出时从最早创建的已结束会话开始淘汰
+MAX_SESSIONS = int(os.getenv("FRAMELEAP_MAX_SESSIONS", "200"))
 
-# 全局存储
-_sessions: dict[str, GenerationSession] = {}
+# 会话版本号：任何会话创建或阶段状态变化时递增，用于会话列表响应缓存
+_sessions_version = 0
+_sessions_list_cache: tuple[int, bytes] = (-1, b"")
 
 
 def create_session(input_text: str, style: str = "anime", resolution: str = "1080p") -> GenerationSession:
@@ -256,17 +375,45 @@ def create_session(input_text: str, style: str = "anime", resolution: str = "108
     # 输入阶段直接完成
     input_node = session.get_node("1_0")
     input_node.status = StageStatus.SUCCESS
-    input_node.start_time = datetime.now()
-    input_node.end_time = datetime.now()
+    input_node.mark_finished(datetime.now(), time.monotonic())
     input_node.output = {
         "input_text": input_text,
         "style": style,
         "resolution": resolution
     }
 
+    _evict_sessions()
+    mark_session_changed(session)
     return session
 
 
+def _evict_sessions():
+    """会话数超过上限时，移除最早创建的已结束会话（运行中的会话不会被淘汰）"""
+    excess = len(_sessions) - MAX_SESSIONS
+    if excess <= 0:
+        return
+    victims = []
+    for session_id, session in _sessions.items():
+        if session.is_terminal():
+            victims.append(session_id)
+            if len(victims) == excess:
+                break
+    for session_id in victims:
+        session = _sessions.pop(session_id)
+        if session._relay is not None:
+            session._relay.close()
+
+
+def mark_session_changed(session: GenerationSession):
+    """阶段状态变化后调用：清除详情缓存、订阅快照和进度缓存，并使会话列表缓存失效"""
+    global _sessions_version
+    session._frozen_response = None
+    session._etag = None
+    session._init_snapshot = None
+    session._progress = None
+    _sessions_version += 1
+
+
 def get_session(session_id: str) -> Optional[GenerationSession]:
     """获取生成会话"""
     return _sessions.get(session_id)
@@ -281,35 +428,106 @@ def list_sessions() -> List[GenerationSession]:
 # WebSocket 连接管理
 # =============================================================================
 
+@dataclass
+class ClientConnection:
+    """WebSocket 客户端连接及其发送队列"""
+    websocket: WebSocket
+    queue: asyncio.Queue
+    sender: Optional[asyncio.Task] = None
+
+
 class ConnectionManager:
-    """WebSocket 连接管理器"""
+    """WebSocket 连接管理器
 
-    def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
+    每个连接有自己的有界发送队列和发送任务，广播只把序列化好的消息放进队列，
+    慢客户端不会拖住其它连接和推送进度的生成任务。
+    """
+
+    # 每个连接最多积压的消息数
+    SEND_QUEUE_SIZE = 64
 
-    async def connect(self, websocket: WebSocket, session_id: str):
+    def __init__(self):
+        # session_id -> {websocket: 连接}，断开时按键移除，不必扫描列表
+        self.active_connections: Dict[str, Dict[WebSocket, ClientConnection]] = {}
+        # 正在关闭的连接任务（保持引用，避免任务被回收）
+        self._closing: set[asyncio.Task] = set()
+
+    async def connect(self, websocket: WebSocket, session_id: str, snapshot: Optional[bytes] = None):
+        """登记连接并启动其发送任务
+
+        Args:
+            websocket: 已接受的WebSocket连接
+            session_id: 订阅的会话ID
+            snapshot: 首条发送的消息（已序列化的会话当前状态），保证先于后续广播到达
+        """
+        client = ClientConnection(websocket=websocket, queue=asyncio.Queue(maxsize=self.SEND_QUEUE_SIZE))
+        if snapshot is not None:
+            client.queue.put_nowait(snapshot)
+        client.sender = asyncio.create_task(self._send_loop(client, session_id))
         if session_id not in self.active_connections:
-            self.active_connections[session_id] = []
-        self.active_connections[session_id].append(websocket)
+            self.active_connections[session_id] = {}
+        self.active_connections[session_id][websocket] = client
 
     def disconnect(self, websocket: WebSocket, session_id: str):
-        if session_id in self.active_connections:
-            self.active_connections[session_id].remove(websocket)
-            if not self.active_connections[session_id]:
-                del self.active_connections[session_id]
+        clients = self.active_connections.get(session_id)
+        if clients is None:
+            return
+        client = clients.pop(websocket, None)
+        if client is not None and client.sender is not asyncio.current_task():
+            client.sender.cancel()
+        if not clients:
+            del self.active_connections[session_id]
+
+    async def _send_loop(self, client: ClientConnection, session_id: str):
+        """连接的发送任务：按顺序发送队列中的消息
+
+        上一帧发送期间积压的多条消息合并成一个 batch 帧发送，
+        消息本身已序列化好，直接拼接字节，不再重新编码
+        """
+        queue = client.queue
+        try:
+            while True:
+                payload = await queue.get()
+                if not queue.empty():
+                    payloads = [payload]
+                    while not queue.empty():
+                        payloads.append(queue.get_nowait())
+                    payload = b'{"type":"batch","events":[' + b",".join(payloads) + b"]}"
+                await client.websocket.send_bytes(payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # 发送失败说明连接已断开
+            self.disconnect(client.websocket, session_id)
 
     async def broadcast_to_session(self, session_id: str, message: dict):
-        if session_id in self.active_connections:
-            disconnected = []
-            for connection in self.active_connections[session_id]:
-                try:
-                    await connection.send_json(message)
-                except Exception:
-                    disconnected.append(connection)
+        clients = self.active_connections.get(session_id)
+        if not clients:
+            return
 
-            # 清理断开的连接
-            for conn in disconnected:
-                self.disconnect(conn, session_id)
+        # 只序列化一次，以二进制帧发送给每个连接
+        payload = _dumps(message)
+        for client in list(clients.values()):
+            try:
+                client.queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                if message.get("type") == "progress_batch":
+                    # 进度会被后续更新覆盖，积压时直接丢弃
+                    continue
+                # 其它消息不能丢：断开跟不上的客户端，由其重连后从 session_init 快照恢复完整状态。
+                # 关闭握手放到后台，不让这个慢客户端拖住对其余连接的广播
+                logger.warning("WebSocket send queue full, dropping client of session %s", session_id)
+                self.disconnect(client.websocket, session_id)
+                task = asyncio.create_task(self._close(client.websocket))
+                self._closing.add(task)
+                task.add_done_callback(self._closing.discard)
+
+    @staticmethod
+    async def _close(websocket: WebSocket):
+        try:
+            await websocket.close(code=1013)
+        except Exception:
+            pass
 
 
 manager = ConnectionManager()
@@ -319,177 +537,386 @@ manager = ConnectionManager()
 # 后台生成任务
 # =============================================================================
 
-async def run_generation_task(session_id: str):
-    """
-    后台运行生成任务
+def _enum_value(value: Any) -> Any:
+    """取枚举的值，非枚举对象转为字符串"""
+    if isinstance(value, Enum):
+        return value.value
+    return str(value)
 
-    执行完整流程，通过 WebSocket 推送进度更新
-    当前实现：阶段1(输入) + 阶段2(故事创作: 2.1剧本 2.2画面 2.3图像)
+
+def _serialize_script(script: ScriptData) -> dict:
+    """序列化剧本数据（2.1 剧本生成阶段输出）"""
+    characters = script.characters
+
+    # 角色属性探测只做一次，不在每个角色上重复 hasattr
+    first_char = next(iter(characters.values()), None)
+    has_personality = hasattr(first_char, "personality")
+    has_appearance = hasattr(first_char, "appearance")
+
+    scenes_data = [
+        {
+            "order": scene.order,
+            "title": scene.title,
+            "description": scene.description,
+            "atmosphere": scene.atmosphere
+        }
+        for scene in script.scenes
+    ]
+    characters_data = [
+        {
+            "id": char_id,
+            "name": char.name,
+            "type": _enum_value(char.character_type),
+            "description": char.description,
+            "personality": char.personality if has_personality else [],
+            "age": char.appearance.age if has_appearance and char.appearance else "unknown",
+            "gender": char.appearance.gender if has_appearance and char.appearance else "unknown"
+        }
+        for char_id, char in characters.items()
+    ]
+
+    return {
+        "title": script.title,
+        "story_type": _enum_value(script.story_type),
+        "theme": script.theme,
+        "premise": script.premise,
+        "scene_count": len(scenes_data),
+        "scenes": scenes_data,
+        "character_count": len(characters_data),
+        "characters": characters_data
+    }
+
+
+def _serialize_images(image_paths: List[str]) -> dict:
+    """序列化图像数据（2.3 图像生成阶段输出）
+
+    图像文件名按场景固定，重新生成会覆盖同名文件。附带的版本号由页面拼接到
+    图像URL上，浏览器可以长期缓存，重新生成后也不会显示旧图
     """
-    print(f"[DEBUG] run_generation_task started for session {session_id}")
-    session = get_session(session_id)
-    if not session:
-        print(f"[DEBUG] Session not found: {session_id}")
-        return
+    return {
+        "image_paths": image_paths,
+        "version": f"{time.time_ns():x}"
+    }
 
-    # 阶段执行顺序（当前实现到2.4）
-    implemented_stages = ["1_0", "2_1", "2_2", "2_3", "2_4"]
 
-    # 创建进度队列
-    progress_queue: asyncio.Queue[tuple[str, float]] = asyncio.Queue()
-    error_queue: asyncio.Queue[Exception] = asyncio.Queue()
+def _serialize_audio(audio: AudioData) -> dict:
+    """序列化音频数据（2.4 音频生成阶段输出）"""
+    tracks_data = [
+        {
+            "id": track.id,
+            "type": track.type,
+            "source": track.source,
+            "duration": track.duration
+        }
+        for track in audio.tracks or []
+    ]
+    return {
+        "track_count": len(tracks_data),
+        "tracks": tracks_data
+    }
 
-    async def progress_dispatcher():
-        """后台任务：从队列处理进度更新并发送WebSocket"""
-        try:
-            while True:
-                stage_name, progress = await progress_queue.get()
-                print(f"[DEBUG] Dispatcher received: {stage_name} - {progress}")
-
-                # 找到对应的 stage_id
-                stage_id = None
-                for sid, sdef in STAGE_DEFINITIONS.items():
-                    if sdef["short_name"] == stage_name or sdef["name"] == stage_name:
-                        stage_id = sid
-                        break
-
-                if stage_id:
-                    node = session.get_node(stage_id)
-                    if node:
-                        node.status = StageStatus.RUNNING
-                        node.progress = progress
-                        if node.start_time is None:
-                            node.start_time = datetime.now()
-
-                        # 推送更新
-                        await manager.broadcast_to_session(session_id, {
-                            "type": "stage_update",
-                            "stage_id": stage_id,
-                            "status": "running",
-                            "progress": progress
-                        })
-                        print(f"[DEBUG] Broadcasted: {stage_id}")
-                progress_queue.task_done()
-        except asyncio.CancelledError:
-            pass
 
-    async def error_dispatcher():
-        """后台任务：从队列处理错误并发送WebSocket"""
+# 生成任务专用线程池：不与默认执行器中的其它 to_thread 调用争用线程
+GEN_POOL_SIZE = int(os.getenv("FRAMELEAP_GEN_POOL_SIZE", "4"))
+GEN_POOL = ThreadPoolExecutor(
+    max_workers=GEN_POOL_SIZE,
+    thread_name_prefix="gen",
+)
+
+# 等待执行的生成任务上限，队列满时拒绝新的生成请求
+GEN_QUEUE_SIZE = int(os.getenv("FRAMELEAP_GEN_QUEUE_SIZE", "32"))
+
+
+async def run_in_gen_pool(func: Callable, *args: Any, **kwargs: Any) -> Any:
+    """在生成任务线程池中执行同步函数"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(GEN_POOL, functools.partial(func, *args, **kwargs))
+
+
+# 空闲的生成器实例：构造开销大，用完归还复用。
+# 生成器在运行期间持有本次任务的回调，同一实例同一时间只服务一个任务。
+_idle_generators: list = []
+
+
+# 生成任务队列及其消费者：同时运行的任务数与线程池大小一致，
+# 多出来的任务在队列中排队，而不是各自起一个协程去争抢线程池
+_gen_queue: Optional[asyncio.Queue] = None
+_gen_workers: List[asyncio.Task] = []
+
+
+async def _gen_worker():
+    """从队列中依次取出会话并执行完整生成流程"""
+    while True:
+        session_id = await _gen_queue.get()
         try:
-            while True:
-                error = await error_queue.get()
-                await manager.broadcast_to_session(session_id, {
+            await run_generation_task(session_id)
+        except Exception:
+            logger.exception("Generation task failed for session %s", session_id)
+        finally:
+            _gen_queue.task_done()
+
+
+def _generation_queue() -> asyncio.Queue:
+    """获取生成任务队列（首次调用时创建队列并启动消费者）"""
+    global _gen_queue
+    if _gen_queue is None:
+        _gen_queue = asyncio.Queue(maxsize=GEN_QUEUE_SIZE)
+        _gen_workers.extend(asyncio.create_task(_gen_worker()) for _ in range(GEN_POOL_SIZE))
+    return _gen_queue
+
+
+def _acquire_generator(progress_callback: Callable, error_callback: Callable):
+    """取出一个空闲生成器（没有则新建），并设置本次任务的回调"""
+    if _idle_generators:
+        generator = _idle_generators.pop()
+    else:
+        generator = Generator(cfg=config)
+    generator._progress_callback = progress_callback
+    generator._error_callback = error_callback
+    return generator
+
+
+def _release_generator(generator):
+    """清除回调并归还生成器"""
+    generator._progress_callback = None
+    generator._error_callback = None
+    _idle_generators.append(generator)
+
+
+# 进度推送合并周期（秒）：回调再频繁，每秒最多唤醒 1 / PROGRESS_FLUSH_INTERVAL 次
+PROGRESS_FLUSH_INTERVAL = 0.05
+
+# 进度最小变化量：同一阶段的进度至少增加这么多才转发（到达1.0时总是转发）
+MIN_PROGRESS_DELTA = 0.01
+
+
+class ProgressRelay:
+    """生成线程到 WebSocket 的进度中继（每个会话一个，会话有任务运行时存在）
+
+    生成器在工作线程中回调。进度和错误写入同一个加锁的待推送字典：进度以
+    ("progress", 处理函数, stage_name) 为键，只保留该阶段的最新进度，积压量以
+    阶段数为上限；错误以 ("error", 序号) 为键逐条保留。字典由空变为非空时才通过
+    call_soon_threadsafe 唤醒 flusher；flusher 被唤醒后再等待一个合并周期，
+    取走积压内容后合并推送，没有内容时不会被唤醒。
+    同一会话的生成和重新生成共用这个中继，各自通过 callbacks() 取得回调，
+    进度按所属任务的处理函数分别合并。
+    """
+
+    def __init__(self, session_id: str):
+        """
+        Args:
+            session_id: 推送目标会话
+        """
+        self.session_id = session_id
+        self._loop = asyncio.get_running_loop()
+        # 待推送内容：("progress", 处理函数, stage_name) -> 最新进度，("error", 序号) -> 异常
+        self._items: Dict[tuple, Any] = {}
+        self._items_lock = threading.Lock()
+        self._error_seq = 0
+        self._pending = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+        # 正在使用这个中继的任务数，归零时停止 flusher（见 release_relay）
+        self.users = 0
+
+    def callbacks(
+        self,
+        on_progress: Callable[[List[tuple[str, float]]], Optional[dict]],
+    ) -> tuple[Callable, Callable]:
+        """
+        为一次生成任务创建 (progress_callback, error_callback)，两者在生成线程中调用
+
+        Args:
+            on_progress: 处理一批 (stage_name, progress)，返回要推送的消息，无需推送时返回None
+        """
+        # 本次任务各阶段最近转发的进度，只在生成线程中读写
+        last_sent: Dict[str, float] = {}
+
+        def progress_callback(stage_name: str, progress: float):
+            # 进度单调递增：重复、回退和过小的变化直接丢弃
+            prev = last_sent.get(stage_name)
+            if prev is not None and progress < prev + MIN_PROGRESS_DELTA and not progress >= 1.0 > prev:
+                return
+            last_sent[stage_name] = progress
+            self._put(("progress", on_progress, stage_name), progress)
+
+        def error_callback(error: Exception):
+            with self._items_lock:
+                self._error_seq += 1
+                key = ("error", self._error_seq)
+            self._put(key, error)
+
+        return progress_callback, error_callback
+
+    def _put(self, key: tuple, value: Any):
+        """写入待推送内容（生成线程中调用），由空变为非空时唤醒 flusher"""
+        with self._items_lock:
+            wake = not self._items
+            self._items[key] = value
+        if wake:
+            self._loop.call_soon_threadsafe(self._pending.set)
+
+    async def _run(self):
+        while True:
+            await self._pending.wait()
+            await asyncio.sleep(PROGRESS_FLUSH_INTERVAL)
+            self._pending.clear()
+            await self.flush()
+
+    async def flush(self):
+        """推送当前积压的进度和错误"""
+        async with self._lock:
+            with self._items_lock:
+                items, self._items = self._items, {}
+            if not items:
+                return
+
+            # 进度按任务分组，同一任务的进度交给它自己的处理函数
+            batches: Dict[Callable, List[tuple[str, float]]] = {}
+            errors: List[Exception] = []
+            for key, value in items.items():
+                if key[0] == "progress":
+                    batches.setdefault(key[1], []).append((key[2], value))
+                else:
+                    errors.append(value)
+
+            for on_progress, progress_items in batches.items():
+                message = on_progress(progress_items)
+                if message:
+                    await manager.broadcast_to_session(self.session_id, message)
+            if errors:
+                await manager.broadcast_to_session(self.session_id, {
                     "type": "error",
-                    "error": str(error)
+                    "error": "\n".join(str(error) for error in errors)
                 })
-        except asyncio.CancelledError:
-            pass
 
-    try:
-        # 启动分发器任务
-        progress_task = asyncio.create_task(progress_dispatcher())
-        error_task = asyncio.create_task(error_dispatcher())
+    def close(self):
+        """停止 flusher（没有任务使用或会话移除时调用）"""
+        if not self._task.done():
+            self._task.cancel()
 
-        # 导入 Generator
-        from app.generator import Generator
-        from app.config import config
 
-        # 创建同步回调
-        def sync_progress_callback(stage_name: str, progress: float):
-            try:
-                progress_queue.put_nowait((stage_name, progress))
-            except Exception as e:
-                print(f"Failed to queue progress: {e}")
+def acquire_relay(session: GenerationSession) -> ProgressRelay:
+    """取得会话的进度中继（没有则创建），任务结束时须调用 release_relay"""
+    if session._relay is None:
+        session._relay = ProgressRelay(session.id)
+    session._relay.users += 1
+    return session._relay
 
-        def sync_error_callback(error: Exception):
-            try:
-                error_queue.put_nowait(error)
-            except Exception as e:
-                print(f"Failed to queue error: {e}")
 
-        # 创建生成器并设置回调
-        import time
-        start = time.time()
-        generator = Generator(cfg=config)
-        elapsed = time.time() - start
-        print(f"[DEBUG] Generator created in {elapsed:.2f}s")
-        generator._progress_callback = sync_progress_callback
-        generator._error_callback = sync_error_callback
+def release_relay(session: GenerationSession):
+    """归还进度中继：最后一个任务结束后停止 flusher 并释放中继"""
+    relay = session._relay
+    relay.users -= 1
+    if relay.users == 0:
+        relay.close()
+        session._relay = None
 
-        print(f"[DEBUG] Starting generation for session {session_id}")
 
-        # 执行生成（在线程池中运行）
-        result = await asyncio.to_thread(
-            generator.generate,
-            text=session.input_text,
-            style=session.style,
-            resolution=session.resolution
-        )
+async def run_generation_task(session_id: str):
+    """
+    后台运行生成任务
 
-        print(f"[DEBUG] Generation completed: success={result.success}")
+    执行完整流程，通过 WebSocket 推送进度更新
+    当前实现：阶段1(输入) + 阶段2(故事创作: 2.1剧本 2.2画面 2.3图像)
+    """
+    logger.debug("run_generation_task started for session %s", session_id)
+    session = get_session(session_id)
+    if not session:
+        logger.debug("Session not found: %s", session_id)
+        return
 
-        # 等待队列处理完毕
-        await progress_queue.join()
-        await error_queue.join()
+    # 阶段执行顺序（当前实现到2.4）
+    implemented_stages = ["1_0", "2_1", "2_2", "2_3", "2_4"]
 
-        # 取消分发器任务
-        progress_task.cancel()
-        error_task.cancel()
-        await asyncio.gather(progress_task, error_task, return_exceptions=True)
+    # 本次任务进入运行状态的阶段（按进入顺序），最后一个即当前阶段
+    started_stages: List[str] = []
+    # 这些阶段提前标记为成功（输出在生成结束后补上，补不上的降级为失败）
+    finished_stages: set[str] = set()
+
+    def finish_started_stages() -> List[dict]:
+        """新阶段开始时，把之前仍在运行的阶段标记为成功，并立即推送实际耗时"""
+        finished = []
+        now, now_mono = datetime.now(), time.monotonic()
+        for stage_id in started_stages:
+            node = session.get_node(stage_id)
+            if stage_id in finished_stages or node.status != StageStatus.RUNNING:
+                continue
+            node.status = StageStatus.SUCCESS
+            node.mark_finished(now, now_mono)
+            finished_stages.add(stage_id)
+            finished.append({
+                "stage_id": stage_id,
+                "status": "success",
+                "progress": node.progress,
+                "duration": node.duration
+            })
+        return finished
 
-        # 更新所有已实现阶段的状态
+    def on_progress(items: List[tuple[str, float]]) -> Optional[dict]:
+        """处理一批进度：同一阶段只保留最新进度，合并为一条消息"""
+        logger.debug("Relay received %d progress updates", len(items))
+
+        # 找到对应的 stage_id，同一阶段后到的进度覆盖先到的
+        latest: Dict[str, float] = {}
+        for stage_name, progress in items:
+            stage_id = _STAGE_NAME_TO_ID.get(stage_name)
+            if stage_id:
+                latest[stage_id] = progress
+
+        updates = []
+        for stage_id, progress in latest.items():
+            node = session.get_node(stage_id)
+            if node and stage_id not in finished_stages:
+                if node.status != StageStatus.RUNNING:
+                    if stage_id not in started_stages:
+                        updates.extend(finish_started_stages())
+                        started_stages.append(stage_id)
+                    node.status = StageStatus.RUNNING
+                    mark_session_changed(session)
+                node.progress = progress
+                if node.start_time is None:
+                    node.mark_started()
+                updates.append({
+                    "stage_id": stage_id,
+                    "status": "running",
+                    "progress": progress
+                })
+
+        if not updates:
+            return None
+        return {"type": "progress_batch", "updates": updates}
+
+    def settle_stages(result: GenerationResult) -> List[dict]:
+        """生成结束后确定本次任务各阶段的最终状态，返回要推送的阶段更新
+
+        生成器返回结果和抛出异常（按失败结果处理）共用这套规则：有产出的阶段为成功，提前标记为成功但没有产出的阶段降级为失败。
+        失败时错误记在当前阶段（最后开始的阶段）上，本次开始的其它阶段标记为中断，
+        尚未开始的阶段标记为跳过；不是本次任务开始的运行中阶段属于其它任务，保持不动
+        """
+        # 同一批阶段共用一个结束时间
+        now, now_mono = datetime.now(), time.monotonic()
+        current_stage_id = started_stages[-1] if started_stages else None
+        input_snapshot = {
+            "input_text": session.input_text,
+            "style": session.style,
+            "resolution": session.resolution
+        }
+        updates = []
         for stage_id in implemented_stages:
             node = session.get_node(stage_id)
             if not node:
                 continue
+            started = stage_id in started_stages
+            if node.status == StageStatus.RUNNING and not started:
+                continue
 
             if result.success:
-                node.status = StageStatus.SUCCESS
-                node.end_time = datetime.now()
-                if node.start_time is None:
-                    node.start_time = node.end_time
-
                 # 收集输出数据
                 if stage_id == "1_0":
-                    node.output = {
-                        "input_text": session.input_text,
-                        "style": session.style,
-                        "resolution": session.resolution
-                    }
+                    node.output = input_snapshot
                 elif stage_id == "2_1" and result.script:
-                    # 序列化场景数据
-                    scenes_data = []
-                    for scene in result.script.scenes:
-                        scenes_data.append({
-                            "order": scene.order,
-                            "title": scene.title,
-                            "description": scene.description,
-                            "atmosphere": scene.atmosphere
-                        })
-
-                    # 序列化角色数据
-                    characters_data = []
-                    for char_id, char in result.script.characters.items():
-                        characters_data.append({
-                            "id": char_id,
-                            "name": char.name,
-                            "type": char.character_type.value if hasattr(char.character_type, 'value') else str(char.character_type),
-                            "description": char.description,
-                            "personality": char.personality if hasattr(char, 'personality') else [],
-                            "age": char.appearance.age if hasattr(char, 'appearance') and char.appearance else "unknown",
-                            "gender": char.appearance.gender if hasattr(char, 'appearance') and char.appearance else "unknown"
-                        })
-
-                    node.output = {
-                        "title": result.script.title,
-                        "story_type": result.script.story_type.value if hasattr(result.script.story_type, 'value') else str(result.script.story_type),
-                        "theme": result.script.theme,
-                        "premise": result.script.premise,
-                        "scene_count": len(result.script.scenes),
-                        "scenes": scenes_data,
-                        "character_count": len(result.script.characters),
-                        "characters": characters_data
-                    }
+                    node.output = _serialize_script(result.script)
                 elif stage_id == "2_2":
                     # 场景描述阶段
                     node.output = {
@@ -497,26 +924,25 @@ async def run_generation_task(session_id: str):
                         "scenes_prepared": len(result.script.scenes) if result.script else 0
                     }
                 elif stage_id == "2_3" and result.images:
-                    node.output = {"image_paths": result.images}
+                    node.output = _serialize_images(result.images)
                 elif stage_id == "2_4" and result.audio:
-                    # 序列化音频数据
-                    tracks_data = []
-                    if result.audio.tracks:
-                        for track in result.audio.tracks:
-                            tracks_data.append({
-                                "id": track.id,
-                                "type": track.type,
-                                "source": track.source,
-                                "duration": track.duration
-                            })
-                    node.output = {
-                        "track_count": len(result.audio.tracks) if result.audio.tracks else 0,
-                        "tracks": tracks_data
-                    }
+                    node.output = _serialize_audio(result.audio)
+            elif not started:
+                # 失败前没有开始的阶段：已有结果的保持不变，其余标记为跳过
+                if node.status == StageStatus.PENDING:
+                    node.status = StageStatus.SKIPPED
+                    node.output = {"message": "前序阶段失败，未执行"}
+                    updates.append({"stage_id": stage_id, "status": "skipped"})
+                continue
+
+            if stage_id not in finished_stages:
+                node.mark_finished(now, now_mono)
 
-                # 推送更新
-                await manager.broadcast_to_session(session_id, {
-                    "type": "stage_update",
+            # 有产出的阶段为成功：生成成功时产出刚收集完，失败时只有已经结束的阶段算数；
+            # 提前标记为成功但没有产出的阶段降级为失败
+            if node.output is not None and (result.success or stage_id in finished_stages):
+                node.status = StageStatus.SUCCESS
+                updates.append({
                     "stage_id": stage_id,
                     "status": "success",
                     "output": node.output,
@@ -524,53 +950,91 @@ async def run_generation_task(session_id: str):
                 })
             else:
                 node.status = StageStatus.FAILED
-                node.error_message = result.error_message
-                node.end_time = datetime.now()
-
-                await manager.broadcast_to_session(session_id, {
-                    "type": "stage_update",
+                if result.success:
+                    node.error_message = "未生成该阶段结果"
+                elif stage_id == current_stage_id:
+                    node.error_message = result.error_message
+                else:
+                    node.error_message = "生成中断"
+                updates.append({
                     "stage_id": stage_id,
                     "status": "failed",
-                    "error": result.error_message,
+                    "error": node.error_message,
                     "duration": node.duration
                 })
 
-        # 标记未实现的阶段为跳过
+        # 未实现的阶段标记为跳过，使会话进入结束状态
         for stage_id in STAGE_DEFINITIONS:
             if stage_id not in implemented_stages:
                 node = session.get_node(stage_id)
                 if node and node.status == StageStatus.PENDING:
                     node.status = StageStatus.SKIPPED
                     node.output = {"message": "该阶段尚未实现"}
+        mark_session_changed(session)
+        return updates
+
+    relay = acquire_relay(session)
+    generator = None
+    try:
+        # 取出生成器并设置回调
+        generator = _acquire_generator(*relay.callbacks(on_progress))
+
+        logger.debug("Starting generation for session %s", session_id)
+
+        # 执行生成（在生成任务线程池中运行）
+        result = await run_in_gen_pool(
+            generator.generate,
+            text=session.input_text,
+            style=session.style,
+            resolution=session.resolution
+        )
+
+        logger.debug("Generation completed: success=%s", result.success)
+
+        # 先推送剩余进度，再推送阶段结果
+        await relay.flush()
+
+        updates = settle_stages(result)
 
-        # 发送完成消息
+        # 推送阶段结果及完成消息
         if result.success:
-            await manager.broadcast_to_session(session_id, {
+            final = {
                 "type": "complete",
                 "output_path": result.video_path,
                 "generation_time": result.generation_time
-            })
+            }
         else:
-            await manager.broadcast_to_session(session_id, {
+            final = {
                 "type": "error",
                 "error": result.error_message
-            })
+            }
+        await manager.broadcast_to_session(session_id, {
+            "type": "stages_batch_update",
+            "updates": updates,
+            "final": final
+        })
 
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        # 标记当前运行中的阶段为失败
-        for stage_id in implemented_stages:
-            node = session.get_node(stage_id)
-            if node and node.status == StageStatus.RUNNING:
-                node.status = StageStatus.FAILED
-                node.error_message = str(e)
-                node.end_time = datetime.now()
-
+        logger.exception("Generation failed for session %s", session_id)
+        # 先推送已到达的进度，避免之后再把失败的阶段改回运行中
+        await relay.flush()
+        # 异常按失败结果处理：当前阶段记录异常，其余阶段与生成器返回失败时一样收尾
+        updates = settle_stages(GenerationResult(success=False, error_message=str(e)))
+
+        # 与正常结束一样先推送各阶段的最终状态，再附带错误消息，
+        # 否则页面上仍显示为运行中的阶段不会结束
         await manager.broadcast_to_session(session_id, {
-            "type": "error",
-            "error": f"生成失败: {str(e)}"
+            "type": "stages_batch_update",
+            "updates": updates,
+            "final": {
+                "type": "error",
+                "error": f"生成失败: {str(e)}"
+            }
         })
+    finally:
+        if generator is not None:
+            _release_generator(generator)
+        release_relay(session)
 
 
 async def run_stage_regeneration(session_id: str, stage_id: str):
@@ -579,10 +1043,10 @@ async def run_stage_regeneration(session_id: str, stage_id: str):
 
     只重新生成指定阶段，不影响其他阶段
     """
-    print(f"[DEBUG] Regenerating stage {stage_id} for session {session_id}")
+    logger.debug("Regenerating stage %s for session %s", stage_id, session_id)
     session = get_session(session_id)
     if not session:
-        print(f"[DEBUG] Session not found: {session_id}")
+        logger.debug("Session not found: %s", session_id)
         return
 
     # 验证阶段ID
@@ -615,101 +1079,39 @@ async def run_stage_regeneration(session_id: str, stage_id: str):
 
     node.status = StageStatus.PENDING
     node.progress = 0.0
-    node.start_time = None
-    node.end_time = None
+    node.reset_timing()
     node.error_message = None
+    mark_session_changed(session)
+
+    def on_progress(items: List[tuple[str, float]]) -> Optional[dict]:
+        # 只重新生成单个阶段，取最后一次进度即可
+        _, progress = items[-1]
+        return {
+            "type": "progress_batch",
+            "updates": [{
+                "stage_id": stage_id,
+                "status": "running",
+                "progress": progress
+            }],
+            "is_regeneration": True
+        }
 
-    # 创建进度队列
-    progress_queue: asyncio.Queue[tuple[str, float]] = asyncio.Queue()
-    error_queue: asyncio.Queue[Exception] = asyncio.Queue()
-
-    async def progress_dispatcher():
-        try:
-            while True:
-                stage_name, progress = await progress_queue.get()
-                await manager.broadcast_to_session(session_id, {
-                    "type": "stage_update",
-                    "stage_id": stage_id,
-                    "status": "running",
-                    "progress": progress,
-                    "is_regeneration": True
-                })
-                progress_queue.task_done()
-        except asyncio.CancelledError:
-            pass
-
-    async def error_dispatcher():
-        try:
-            while True:
-                error = await error_queue.get()
-                await manager.broadcast_to_session(session_id, {
-                    "type": "error",
-                    "error": str(error)
-                })
-        except asyncio.CancelledError:
-            pass
-
+    relay = acquire_relay(session)
+    generator = None
     try:
-        progress_task = asyncio.create_task(progress_dispatcher())
-        error_task = asyncio.create_task(error_dispatcher())
-
-        from app.generator import Generator
-        from app.config import config
-
-        def sync_progress_callback(stage_name: str, progress: float):
-            try:
-                progress_queue.put_nowait((stage_name, progress))
-            except Exception as e:
-                print(f"Failed to queue progress: {e}")
-
-        def sync_error_callback(error: Exception):
-            try:
-                error_queue.put_nowait(error)
-            except Exception as e:
-                print(f"Failed to queue error: {e}")
-
-        generator = Generator(cfg=config)
-        generator._progress_callback = sync_progress_callback
-        generator._error_callback = sync_error_callback
+        generator = _acquire_generator(*relay.callbacks(on_progress))
+        node.mark_started()
 
         # 根据阶段执行不同的生成逻辑
         if stage_id == "2_1":
             # 重新生成剧本
-            script = await asyncio.to_thread(
+            script = await run_in_gen_pool(
                 generator.generate_script,
                 session.input_text,
                 session.style
             )
             if script:
-                scenes_data = []
-                for scene in script.scenes:
-                    scenes_data.append({
-                        "order": scene.order,
-                        "title": scene.title,
-                        "description": scene.description,
-                        "atmosphere": scene.atmosphere
-                    })
-
-                characters_data = []
-                for char_id, char in script.characters.items():
-                    characters_data.append({
-                        "id": char_id,
-                        "name": char.name,
-                        "type": char.character_type.value if hasattr(char.character_type, 'value') else str(char.character_type),
-                        "description": char.description,
-                        "personality": char.personality if hasattr(char, 'personality') else [],
-                    })
-
-                node.output = {
-                    "title": script.title,
-                    "story_type": script.story_type.value if hasattr(script.story_type, 'value') else str(script.story_type),
-                    "theme": script.theme,
-                    "premise": script.premise,
-                    "scene_count": len(script.scenes),
-                    "scenes": scenes_data,
-                    "character_count": len(script.characters),
-                    "characters": characters_data
-                }
+                node.output = _serialize_script(script)
                 node.status = StageStatus.SUCCESS
             else:
                 node.status = StageStatus.FAILED
@@ -726,14 +1128,14 @@ async def run_stage_regeneration(session_id: str, stage_id: str):
 
         elif stage_id == "2_3":
             # 重新生成图像
-            images = await asyncio.to_thread(
+            images = await run_in_gen_pool(
                 generator.generate_images,
                 session.input_text,
                 session.style,
                 session.resolution
             )
             if images:
-                node.output = {"image_paths": images}
+                node.output = _serialize_images(images)
                 node.status = StageStatus.SUCCESS
             else:
                 node.status = StageStatus.FAILED
@@ -741,27 +1143,14 @@ async def run_stage_regeneration(session_id: str, stage_id: str):
 
         elif stage_id == "2_4":
             # 重新生成音频
-            audio_data = await asyncio.to_thread(
+            audio_data = await run_in_gen_pool(
                 generator.generate_audio,
                 session.input_text,
                 session.style,
                 session.resolution
             )
             if audio_data:
-                # 序列化音频数据
-                tracks_data = []
-                if audio_data.tracks:
-                    for track in audio_data.tracks:
-                        tracks_data.append({
-                            "id": track.id,
-                            "type": track.type,
-                            "source": track.source,
-                            "duration": track.duration
-                        })
-                node.output = {
-                    "track_count": len(audio_data.tracks) if audio_data.tracks else 0,
-                    "tracks": tracks_data
-                }
+                node.output = _serialize_audio(audio_data)
                 node.status = StageStatus.SUCCESS
             else:
                 node.status = StageStatus.FAILED
@@ -771,16 +1160,10 @@ async def run_stage_regeneration(session_id: str, stage_id: str):
             node.status = StageStatus.SKIPPED
             node.error_message = "该阶段暂不支持重新生成"
 
-        node.end_time = datetime.now()
-        if node.start_time is None:
-            node.start_time = node.end_time
-
-        await progress_queue.join()
-        await error_queue.join()
+        node.mark_finished(datetime.now(), time.monotonic())
+        mark_session_changed(session)
 
-        progress_task.cancel()
-        error_task.cancel()
-        await asyncio.gather(progress_task, error_task, return_exceptions=True)
+        await relay.flush()
 
         await manager.broadcast_to_session(session_id, {
             "type": "stage_update",
@@ -792,11 +1175,12 @@ async def run_stage_regeneration(session_id: str, stage_id: str):
         })
 
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Regeneration of stage %s failed for session %s", stage_id, session_id)
+        await relay.flush()
         node.status = StageStatus.FAILED
         node.error_message = str(e)
-        node.end_time = datetime.now()
+        node.mark_finished(datetime.now(), time.monotonic())
+        mark_session_changed(session)
 
         await manager.broadcast_to_session(session_id, {
             "type": "stage_update",
@@ -805,6 +1189,10 @@ async def run_stage_regeneration(session_id: str, stage_id: str):
             "error": str(e),
             "is_regeneration": True
         })
+    finally:
+        if generator is not None:
+            _release_generator(generator)
+        release_relay(session)
 
 
 # =============================================================================
@@ -813,16 +1201,133 @@ async def run_stage_regeneration(session_id: str, stage_id: str):
 
 app = FastAPI(title="FrameLeap")
 
+# 压缩文本响应（主页、脚本样式、会话JSON）；图像等已压缩格式由中间件按类型跳过
+from starlette.middleware.gzip import GZipMiddleware
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 # 挂载静态文件目录
 from fastapi.staticfiles import StaticFiles
-from app.config import config
+from starlette.background import BackgroundTask
+import anyio
 
 # 确保temp目录存在
 temp_dir = Path(config.paths.temp_dir)
 temp_dir.mkdir(parents=True, exist_ok=True)
 
-# 挂载temp目录为静态文件
-app.mount("/temp", StaticFiles(directory=str(temp_dir)), name="temp")
+
+class CachedStaticFiles(StaticFiles):
+    """带缓存策略的静态文件
+
+    URL带版本参数 v 时（内容变化后URL随之变化）让浏览器永久缓存；
+    不带版本参数时每次使用前向服务器验证，由ETag/Last-Modified返回304。
+    不超过 MEMORY_CACHE_MAX_FILE_SIZE 的文件内容缓存在内存中（LRU，总量不超过
+    MEMORY_CACHE_MAX_BYTES），文件修改时间或大小变化后重新读取。未命中时本次仍由
+    FileResponse 发送，响应结束后在线程中读取文件填充缓存，不阻塞事件循环；更大的文件由
+    FileResponse 发送（服务器支持 pathsend 扩展时零拷贝）。部署在 nginx 后面时
+    可设置 accel_redirect_prefix，大文件改为返回 X-Accel-Redirect 由 nginx 直接发送
+    """
+
+    MEMORY_CACHE_MAX_FILE_SIZE = 256 * 1024
+    MEMORY_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+    def __init__(self, *args: Any, accel_redirect_prefix: Optional[str] = None, **kwargs: Any):
+        """
+        Args:
+            accel_redirect_prefix: nginx internal location 前缀（如 /_protected/temp），None表示不启用
+        """
+        super().__init__(*args, **kwargs)
+        self.accel_redirect_prefix = accel_redirect_prefix.rstrip("/") if accel_redirect_prefix else None
+        # 文件路径 -> (st_mtime_ns, st_size, 内容)
+        self._memory_cache: OrderedDict[str, tuple[int, int, bytes]] = OrderedDict()
+        self._memory_cache_bytes = 0
+        # 正在后台填充缓存的文件路径，避免并发请求重复读取
+        self._filling: set[str] = set()
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if (
+            response.status_code == status_code
+            and scope["method"] == "GET"
+            and stat_result.st_size <= self.MEMORY_CACHE_MAX_FILE_SIZE
+            and not any(name == b"range" for name, _ in scope["headers"])
+        ):
+            # 小文件直接返回内存中的内容，沿用 FileResponse 算好的响应头
+            path = str(full_path)
+            content = self._cached_content(path, stat_result)
+            if content is not None:
+                response = Response(content=content, status_code=status_code, headers=dict(response.headers))
+            elif path not in self._filling:
+                self._filling.add(path)
+                response.background = BackgroundTask(self._fill_cache, path, stat_result)
+        elif response.status_code == status_code and self.accel_redirect_prefix and self.directory:
+            # 交给 nginx 发送文件，Range/HEAD 也由 nginx 处理
+            relative = Path(os.path.relpath(full_path, self.directory)).as_posix()
+            headers = {
+                key: value for key, value in response.headers.items()
+                if key not in ("content-length", "accept-ranges")
+            }
+            headers["X-Accel-Redirect"] = f"{self.accel_redirect_prefix}/{quote(relative)}"
+            response = Response(status_code=status_code, headers=headers)
+
+        query = scope.get("query_string", b"")
+        if query.startswith(b"v=") or b"&v=" in query:
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        else:
+            response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    def _cached_content(self, path: str, stat_result: os.stat_result) -> Optional[bytes]:
+        """取内存缓存中的文件内容，未缓存或文件已变化时返回None"""
+        cache = self._memory_cache
+        entry = cache.get(path)
+        if entry is not None and entry[0] == stat_result.st_mtime_ns and entry[1] == stat_result.st_size:
+            cache.move_to_end(path)
+            return entry[2]
+        return None
+
+    async def _fill_cache(self, path: str, stat_result: os.stat_result) -> None:
+        """在线程中读取文件内容并放入内存缓存"""
+        try:
+            content = await anyio.to_thread.run_sync(Path(path).read_bytes)
+        except OSError:
+            return
+        finally:
+            self._filling.discard(path)
+        if len(content) != stat_result.st_size:
+            # 读取期间文件被修改，留给下次请求按新的状态重新读取
+            return
+
+        cache = self._memory_cache
+        entry = cache.get(path)
+        if entry is not None:
+            self._memory_cache_bytes -= len(entry[2])
+        cache[path] = (stat_result.st_mtime_ns, stat_result.st_size, content)
+        cache.move_to_end(path)
+        self._memory_cache_bytes += len(content)
+        while self._memory_cache_bytes > self.MEMORY_CACHE_MAX_BYTES:
+            _, (_, _, evicted) = cache.popitem(last=False)
+            self._memory_cache_bytes -= len(evicted)
+
+
+# 挂载temp目录为静态文件（生成的图像等，页面引用时带版本参数）
+app.mount(
+    "/temp",
+    CachedStaticFiles(
+        directory=str(temp_dir),
+        accel_redirect_prefix=os.getenv("FRAMELEAP_TEMP_ACCEL_REDIRECT") or None,
+    ),
+    name="temp",
+)
+
+# 主页的样式和脚本（页面引用时带内容哈希，见 _static_url）
+STATIC_DIR = Path(__file__).parent / "static"
+app.mount("/static", CachedStaticFiles(directory=str(STATIC_DIR)), name="static")
+
+
+def _static_url(name: str) -> str:
+    """静态资源URL，附带内容哈希作为版本号"""
+    digest = hashlib.blake2b((STATIC_DIR / name).read_bytes(), digest_size=8).hexdigest()
+    return f"/static/{name}?v={digest}"
 
 
 class GenerateRequest(BaseModel):
@@ -838,34 +1343,68 @@ class RegenerateRequest(BaseModel):
     stage_id: str
 
 
-@app.get("/", response_class=HTMLResponse)
-async def index():
-    """主页"""
-    import json
+# 模板占位符：__NAME__
+_TEMPLATE_PLACEHOLDER = re.compile(r"__([A-Z][A-Z_]*[A-Z])__")
+
+
+def _script_json(obj: Any) -> str:
+    """序列化为可直接嵌入 <script type="application/json"> 的JSON（转义 < > &，避免提前闭合标签）"""
+    return (
+        _dumps(obj).decode("utf-8")
+        .replace("<", "\\u003c")
+        .replace(">", "\\u003e")
+        .replace("&", "\\u0026")
+    )
+
+
+def _render_template(template: str, context: Dict[str, str]) -> str:
+    """一次扫描替换模板中的所有占位符，模板中出现未提供的占位符时报错"""
+    def substitute(match: re.Match) -> str:
+        name = match.group(1)
+        if name not in context:
+            raise KeyError(f"模板占位符未提供: __{name}__")
+        return context[name]
 
-    # 检查LLM配置状态
-    llm_configured = bool(config.api.llm_api_key)
+    return _TEMPLATE_PLACEHOLDER.sub(substitute, template)
 
-    # 将阶段定义转换为JSON字符串
-    stages_json = json.dumps(STAGE_DEFINITIONS, ensure_ascii=False)
-    groups_json = json.dumps(STAGE_GROUPS, ensure_ascii=False)
-    order_json = json.dumps(STAGE_ORDER, ensure_ascii=False)
-    deps_json = json.dumps(STAGE_DEPENDENCIES, ensure_ascii=False)
 
-    # 读取HTML模板
+def _render_index() -> str:
+    """渲染主页HTML"""
+    # 读取HTML模板（样式和脚本在 static 目录中）
     html_template = Path(__file__).parent / "templates" / "index.html"
-    if not html_template.exists():
-        # 如果模板文件不存在，返回内嵌的HTML
-        return HTMLResponse(content=get_embedded_html(stages_json, groups_json, order_json, deps_json, llm_configured))
+    return _render_template(html_template.read_text(encoding='utf-8'), {
+        "APP_CSS_URL": _static_url("app.css"),
+        "APP_JS_URL": _static_url("app.js"),
+        # 阶段数据以 JSON 数据块嵌入页面，由 app.js 解析，页面中没有内联可执行脚本
+        "STAGE_DATA": _script_json({
+            "definitions": STAGE_DEFINITIONS,
+            "groups": STAGE_GROUPS,
+            "order": STAGE_ORDER,
+            "dependencies": STAGE_DEPENDENCIES,
+        }),
+        # 已配置LLM时直接隐藏配置警告，页面无需再检查
+        "CONFIG_WARNING_HIDDEN": " hidden" if config.api.llm_api_key else "",
+    })
 
-    html_content = html_template.read_text(encoding='utf-8')
-    html_content = html_content.replace('__STAGE_DEFINITIONS__', stages_json)
-    html_content = html_content.replace('__STAGE_GROUPS__', groups_json)
-    html_content = html_content.replace('__STAGE_ORDER__', order_json)
-    html_content = html_content.replace('__STAGE_DEPENDENCIES__', deps_json)
-    html_content = html_content.replace('__LLM_CONFIGURED__', str(llm_configured).lower())
 
-    return HTMLResponse(content=html_content)
+@app.get("/", response_class=HTMLResponse)
+async def index(request: Request):
+    """主页
+
+    主页内容在启动后不变，直接返回导入时渲染（并压缩）好的字节，并支持ETag协商缓存。
+    已带 Content-Encoding 的响应不会被 GZipMiddleware 再次压缩
+    """
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        content, etag = _INDEX_HTML_GZ, _INDEX_ETAG_GZ
+        headers = {"Content-Encoding": "gzip"}
+    else:
+        content, etag = _INDEX_HTML, _INDEX_ETAG
+        headers = {}
+    headers.update({"ETag": etag, "Cache-Control": "public, max-age=300", "Vary": "Accept-Encoding"})
+    if _etag_matches(request, etag):
+        headers.pop("Content-Encoding", None)
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type="text/html; charset=utf-8", headers=headers)
 
 
 
@@ -873,22 +1412,24 @@ async def index():
 @app.get("/api/config/check")
 async def check_config():
     """检查配置状态"""
-    return {
+    body = _dumps({
         "llm_configured": bool(config.api.llm_api_key),
         "llm_provider": config.api.llm_provider,
         "llm_model": config.api.llm_model
-    }
+    })
+    return Response(content=body, media_type="application/json")
 
 
 @app.post("/api/generate")
 async def start_generation(request: GenerateRequest):
     """开始生成"""
+    queue = _generation_queue()
+    if queue.full():
+        raise HTTPException(status_code=503, detail="生成任务过多，请稍后再试")
     session = create_session(request.text, request.style, request.resolution)
-    asyncio.create_task(run_generation_task(session.id))
-    return {
-        "session_id": session.id,
-        "stages": STAGE_DEFINITIONS
-    }
+    queue.put_nowait(session.id)
+    body = b'{"session_id":' + _dumps(session.id) + b',"stages":' + _STAGE_DEFINITIONS_JSON + b'}'
+    return Response(content=body, media_type="application/json")
 
 
 @app.post("/api/regenerate_stage")
@@ -900,53 +1441,67 @@ async def regenerate_stage_api(request: RegenerateRequest, background_tasks: Bac
 
     background_tasks.add_task(run_stage_regeneration, request.session_id, request.stage_id)
 
-    return {
+    body = _dumps({
         "success": True,
         "message": f"开始重新生成阶段: {request.stage_id}"
-    }
+    })
+    return Response(content=body, media_type="application/json")
 
 
 @app.get("/api/sessions")
 async def list_sessions_api():
-    """列出所有生成会话"""
-    sessions = list_sessions()
-    return {
-        "sessions": [
-            {
-                "id": s.id,
-                "input": s.input_text[:100],
-                "style": s.style,
-                "resolution": s.resolution,
-                "create_time": s.create_time.isoformat(),
-                "progress": s.get_progress(),
-            }
-            for s in sessions
-        ]
-    }
+    """列出所有生成会话
 
+    序列化结果按会话版本号缓存，会话未变化时直接返回缓存的字节
+    """
+    global _sessions_list_cache
+    version, body = _sessions_list_cache
+    if version != _sessions_version:
+        body = _dumps({
+            "sessions": [
+                {
+                    "id": s.id,
+                    "input": s.input_text[:100],
+                    "style": s.style,
+                    "resolution": s.resolution,
+                    "create_time": s._create_time_iso,
+                    "progress": s.get_progress(),
+                }
+                for s in list_sessions()
+            ]
+        })
+        _sessions_list_cache = (_sessions_version, body)
+    return Response(content=body, media_type="application/json")
 
-@app.get("/api/sessions/{session_id}")
-async def get_session_api(session_id: str):
-    """获取生成会话详情"""
-    session = get_session(session_id)
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
 
+def _etag_matches(request: Request, etag: str) -> bool:
+    """检查请求的 If-None-Match 是否命中给定ETag"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in (t.strip() for t in if_none_match.split(","))
+
+
+def _session_detail(session: GenerationSession) -> dict:
+    """构建会话详情响应
+
+    状态枚举和时间直接交给 _dumps 序列化（orjson 原生支持，标准库走 _json_default）
+    """
     return {
         "id": session.id,
         "input": session.input_text,
         "style": session.style,
         "resolution": session.resolution,
-        "create_time": session.create_time.isoformat(),
+        "create_time": session._create_time_iso,
         "progress": session.get_progress(),
         "stages": {
             stage_id: {
                 "id": node.id,
                 "stage_id": node.stage_id,
                 "stage_name": node.stage_name,
-                "status": node.status.value,
-                "start_time": node.start_time.isoformat() if node.start_time else None,
-                "end_time": node.end_time.isoformat() if node.end_time else None,
+                "status": node.status,
+                "start_time": node.start_time,
+                "end_time": node.end_time,
                 "duration": node.duration,
                 "error_message": node.error_message,
                 "output": node.output,
@@ -957,998 +1512,53 @@ async def get_session_api(session_id: str):
     }
 
 
-@app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket端点，推送更新"""
-    await websocket.accept()
-
-    session_id = None
-
-    try:
-        while True:
-            data = await websocket.receive_json()
-
-            if data.get("type") == "subscribe":
-                session_id = data.get("session_id")
-                session = get_session(session_id)
-
-                if session:
-                    await manager.connect(websocket, session_id)
-
-                    # 发送当前会话状态
-                    await websocket.send_json({
-                        "type": "session_init",
-                        "session_id": session.id,
-                        "stages": STAGE_DEFINITIONS,
-                        "groups": STAGE_GROUPS,
-                        "order": STAGE_ORDER,
-                        "progress": session.get_progress(),
-                        "nodes": {
-                            stage_id: {
-                                "status": node.status.value,
-                                "output": node.output,
-                                "duration": node.duration,
-                                "error": node.error_message
-                            }
-                            for stage_id, node in session.nodes.items()
-                        }
-                    })
+@app.get("/api/sessions/{session_id}")
+async def get_session_api(session_id: str, request: Request):
+    """获取生成会话详情
 
-    except WebSocketDisconnect:
-        if session_id:
-            manager.disconnect(websocket, session_id)
-    except Exception as e:
-        print(f"WebSocket error: {e}")
-
-def get_embedded_html(stages_json: str, groups_json: str, order_json: str, deps_json: str, llm_configured: bool) -> str:
-    """获取内嵌的HTML内容"""
-    return f"""
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>FrameLeap - 动态漫生成</title>
-    <style>
-        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-        body {{
-            font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, sans-serif;
-            background: #f1f5f9;
-            color: #1e293b;
-            min-height: 100vh;
-        }}
-        .container {{
-            max-width: 1800px;
-            margin: 0 auto;
-            padding: 20px;
-        }}
-
-        /* 标题 */
-        .header {{
-            text-align: center;
-            margin-bottom: 30px;
-            padding: 30px 0;
-            background: linear-gradient(135deg, #2563eb 0%, #3b82f6 50%, #06b6d4 100%);
-            border-radius: 16px;
-            box-shadow: 0 4px 20px rgba(37, 99, 235, 0.15);
-        }}
-        .header h1 {{
-            color: #ffffff;
-            font-size: 2.5em;
-            margin-bottom: 10px;
-            font-weight: 700;
-        }}
-        .header p {{
-            color: rgba(255, 255, 255, 0.9);
-            font-size: 1.1em;
-        }}
-
-        /* 配置警告 */
-        .config-warning {{
-            background: #fff7ed;
-            border: 2px solid #f59e0b;
-            border-radius: 12px;
-            padding: 16px 20px;
-            margin-bottom: 20px;
-            display: {'flex' if not llm_configured else 'none'};
-            align-items: center;
-            gap: 16px;
-        }}
-        .warning-content {{
-            display: flex;
-            align-items: center;
-            gap: 12px;
-            flex: 1;
-        }}
-        .warning-icon {{ font-size: 28px; }}
-        .warning-text {{
-            color: #92400e;
-            font-size: 14px;
-        }}
-
-        /* 输入区域 */
-        .input-section {{
-            background: #ffffff;
-            border-radius: 16px;
-            padding: 30px;
-            margin-bottom: 30px;
-            border: 1px solid #e2e8f0;
-            box-shadow: 0 1px 3px rgba(0, 0, 0, 0.05);
-        }}
-        .input-group {{ margin-bottom: 15px; }}
-        .input-group label {{
-            display: block;
-            margin-bottom: 10px;
-            color: #334155;
-            font-weight: 600;
-            font-size: 14px;
-        }}
-        textarea {{
-            width: 100%;
-            height: 100px;
-            background: #f8fafc;
-            border: 1px solid #cbd5e1;
-            border-radius: 10px;
-            color: #1e293b;
-            padding: 16px;
-            font-size: 14px;
-            resize: vertical;
-            transition: all 0.2s;
-            font-family: inherit;
-        }}
-        textarea:focus {{
-            outline: none;
-            border-color: #2563eb;
-            box-shadow: 0 0 0 3px rgba(37, 99, 235, 0.1);
-            background: #ffffff;
-        }}
-        .controls {{
-            display: flex;
-            gap: 15px;
-            flex-wrap: wrap;
-            margin-top: 20px;
-        }}
-        select {{
-            flex: 1;
-            min-width: 150px;
-            padding: 12px 16px;
-            border-radius: 10px;
-            background: #f8fafc;
-            color: #334155;
-            border: 1px solid #cbd5e1;
-            cursor: pointer;
-            font-size: 14px;
-        }}
-        .btn {{
-            padding: 12px 32px;
-            border: none;
-            border-radius: 10px;
-            cursor: pointer;
-            font-size: 15px;
-            font-weight: 600;
-            transition: all 0.2s;
-        }}
-        .btn-primary {{
-            background: linear-gradient(135deg, #2563eb, #3b82f6);
-            color: #ffffff;
-            box-shadow: 0 2px 10px rgba(37, 99, 235, 0.2);
-        }}
-        .btn-primary:hover {{
-            transform: translateY(-1px);
-            box-shadow: 0 4px 15px rgba(37, 99, 235, 0.3);
-        }}
-        .btn-primary:disabled {{
-            opacity: 0.5;
-            cursor: not-allowed;
-            transform: none;
-        }}
-
-        /* 进度条 */
-        .progress-section {{
-            background: #ffffff;
-            border-radius: 12px;
-            padding: 20px;
-            margin-bottom: 20px;
-            display: none;
-            border: 1px solid #e2e8f0;
-        }}
-        .progress-section.active {{ display: block; }}
-        .progress-bar-container {{
-            height: 6px;
-            background: #f1f5f9;
-            border-radius: 3px;
-            overflow: hidden;
-            margin-bottom: 10px;
-        }}
-        .progress-bar {{
-            height: 100%;
-            background: linear-gradient(90deg, #2563eb, #3b82f6, #06b6d4);
-            border-radius: 3px;
-            transition: width 0.4s ease;
-            width: 0%;
-        }}
-        .progress-text {{
-            text-align: center;
-            color: #64748b;
-            font-size: 14px;
-        }}
-
-        /* 流程展示区域 */
-        .flow-section {{ display: none; }}
-        .flow-section.active {{ display: block; }}
-
-        /* 阶段分组 */
-        .stage-group {{
-            margin-bottom: 24px;
-        }}
-        .group-header {{
-            background: linear-gradient(135deg, #e0e7ff 0%, #f3e8ff 100%);
-            border-radius: 12px;
-            padding: 16px 24px;
-            margin-bottom: 12px;
-            display: flex;
-            align-items: center;
-            gap: 12px;
-            border: 1px solid #c7d2fe;
-        }}
-        .group-icon {{ font-size: 28px; }}
-        .group-name {{
-            font-size: 18px;
-            font-weight: 700;
-            color: #3730a3;
-        }}
-        .group-stages {{
-            display: flex;
-            flex-direction: column;
-            gap: 12px;
-        }}
-
-        /* 阶段行 */
-        .stage-row {{
-            display: flex;
-            background: #ffffff;
-            border: 1px solid #e2e8f0;
-            border-radius: 12px;
-            overflow: hidden;
-            transition: all 0.3s;
-        }}
-        .stage-row:hover {{
-            box-shadow: 0 4px 20px rgba(0, 0, 0, 0.08);
-        }}
-
-        /* 左侧阶段信息 */
-        .stage-info {{
-            flex-shrink: 0;
-            width: 320px;
-            padding: 16px 20px;
-            border-right: 1px solid #e2e8f0;
-            background: #f8fafc;
-            display: flex;
-            align-items: center;
-            gap: 12px;
-        }}
-        .stage-info-icon {{ font-size: 32px; flex-shrink: 0; }}
-        .stage-info-text {{ flex: 1; min-width: 0; }}
-        .stage-info-name {{
-            font-weight: 600;
-            font-size: 15px;
-            color: #1e293b;
-            margin-bottom: 4px;
-        }}
-        .stage-info-sub {{
-            font-size: 11px;
-            color: #64748b;
-            font-weight: 600;
-            text-transform: uppercase;
-        }}
-        .stage-info-desc {{
-            font-size: 12px;
-            color: #94a3b8;
-            line-height: 1.4;
-        }}
-
-        /* 状态指示器 */
-        .stage-status-indicator {{
-            width: 12px;
-            height: 12px;
-            border-radius: 50%;
-            flex-shrink: 0;
-        }}
-        .status-pending {{ background: #cbd5e1; }}
-        .status-running {{
-            background: #f59e0b;
-            animation: pulse 1.5s infinite;
-        }}
-        .status-success {{ background: #10b981; }}
-        .status-failed {{ background: #ef4444; }}
-        .status-skipped {{ background: #94a3b8; }}
-
-        @keyframes pulse {{
-            0%, 100% {{ opacity: 1; }}
-            50% {{ opacity: 0.5; }}
-        }}
-
-        /* 重新生成按钮 */
-        .stage-regenerate-btn {{
-            padding: 6px 14px;
-            font-size: 12px;
-            border: 1px solid #e2e8f0;
-            border-radius: 8px;
-            background: #ffffff;
-            color: #64748b;
-            cursor: pointer;
-            transition: all 0.2s;
-            margin-left: auto;
-            white-space: nowrap;
-        }}
-        .stage-regenerate-btn:hover:not(:disabled) {{
-            background: #f8fafc;
-            border-color: #2563eb;
-            color: #2563eb;
-        }}
-        .stage-regenerate-btn:disabled {{
-            opacity: 0.4;
-            cursor: not-allowed;
-        }}
-
-        /* 右侧结果区域 */
-        .stage-results {{
-            flex: 1;
-            padding: 20px;
-            display: flex;
-            gap: 16px;
-            overflow-x: auto;
-            min-height: 120px;
-            align-items: stretch;
-        }}
-        .stage-results::-webkit-scrollbar {{
-            height: 8px;
-        }}
-        .stage-results::-webkit-scrollbar-track {{
-            background: #f1f5f9;
-            border-radius: 4px;
-        }}
-        .stage-results::-webkit-scrollbar-thumb {{
-            background: #cbd5e1;
-            border-radius: 4px;
-        }}
-
-        /* 空状态 */
-        .empty-state {{
-            flex: 1;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            color: #94a3b8;
-            font-size: 14px;
-        }}
-
-        /* 结果卡片 */
-        .result-card {{
-            flex-shrink: 0;
-            width: 300px;
-            background: #ffffff;
-            border: 1px solid #e2e8f0;
-            border-radius: 10px;
-            overflow: hidden;
-            transition: all 0.2s;
-        }}
-        .result-card:hover {{
-            box-shadow: 0 4px 15px rgba(0, 0, 0, 0.1);
-            transform: translateY(-2px);
-        }}
-        .result-header {{
-            padding: 12px 16px;
-            background: #f8fafc;
-            border-bottom: 1px solid #e2e8f0;
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-        }}
-        .result-title {{
-            font-size: 13px;
-            font-weight: 600;
-            color: #334155;
-        }}
-        .result-time {{
-            font-size: 11px;
-            color: #94a3b8;
-        }}
-        .result-content {{
-            padding: 16px;
-            max-height: 280px;
-            overflow-y: auto;
-        }}
-
-        /* 结果内容样式 */
-        .result-text {{
-            font-size: 13px;
-            line-height: 1.6;
-            color: #334155;
-        }}
-        .result-text strong {{
-            color: #2563eb;
-            font-weight: 600;
-        }}
-
-        /* 场景列表 */
-        .scene-list {{
-            display: flex;
-            flex-direction: column;
-            gap: 8px;
-        }}
-        .scene-item {{
-            padding: 10px 12px;
-            background: #f8fafc;
-            border-radius: 8px;
-            border: 1px solid #e2e8f0;
-        }}
-        .scene-title {{
-            font-size: 13px;
-            font-weight: 600;
-            color: #2563eb;
-            margin-bottom: 4px;
-        }}
-        .scene-desc {{
-            font-size: 12px;
-            color: #64748b;
-            line-height: 1.4;
-        }}
-
-        /* 图像网格 */
-        .image-grid {{
-            display: grid;
-            grid-template-columns: repeat(2, 1fr);
-            gap: 8px;
-        }}
-        .image-item {{
-            aspect-ratio: 16/10;
-            border-radius: 8px;
-            overflow: hidden;
-            border: 1px solid #e2e8f0;
-            background: #f1f5f9;
-        }}
-        .image-item img {{
-            width: 100%;
-            height: 100%;
-            object-fit: cover;
-        }}
-
-        /* 响应式 */
-        @media (max-width: 768px) {{
-            .stage-row {{ flex-direction: column; }}
-            .stage-info {{ width: 100%; border-right: none; border-bottom: 1px solid #e2e8f0; }}
-            .stage-results {{ flex-direction: column; }}
-            .result-card {{ width: 100%; }}
-        }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>🎬 FrameLeap</h1>
-            <p>AI驱动的动态漫生成系统 - 4大阶段8个子流程</p>
-        </div>
-
-        <!-- 配置警告 -->
-        <div class="config-warning" id="configWarning">
-            <div class="warning-content">
-                <span class="warning-icon">⚠️</span>
-                <div class="warning-text">
-                    <strong>未配置千问 API Key</strong><br>
-                    剧本生成将使用简化规则。请配置 API Key 以获得更好的生成效果。
-                </div>
-            </div>
-        </div>
-
-        <!-- 输入区域 -->
-        <div class="input-section">
-            <div class="input-group">
-                <label>📝 输入你的故事</label>
-                <textarea id="inputText" placeholder="输入你想要生成的故事...&#10;&#10;例如：&#10;一个少年在雨夜中遇到了神秘少女。少女告诉他，他是被选中的勇者，必须拯救即将崩塌的世界。"></textarea>
-            </div>
-            <div class="controls">
-                <select id="style">
-                    <option value="anime">🎨 日式动漫</option>
-                    <option value="manhwa">📖 韩漫</option>
-                    <option value="manhua">🏮 国漫</option>
-                    <option value="watercolor">🎨 水彩风</option>
-                    <option value="oil">🖼️ 油画风</option>
-                </select>
-                <select id="resolution">
-                    <option value="1080p">📺 1080P 横屏</option>
-                    <option value="1080p_v">📱 1080P 竖屏</option>
-                    <option value="720p">📺 720P</option>
-                </select>
-                <button class="btn btn-primary" id="generateBtn" onclick="startGeneration()">
-                    🚀 开始生成
-                </button>
-            </div>
-        </div>
-
-        <!-- 进度区域 -->
-        <div class="progress-section" id="progressSection">
-            <div class="progress-bar-container">
-                <div class="progress-bar" id="progressBar"></div>
-            </div>
-            <div class="progress-text" id="progressText">准备中...</div>
-        </div>
-
-        <!-- 流程展示区域 -->
-        <div class="flow-section" id="flowSection">
-            <div id="pipelineContainer"></div>
-        </div>
-    </div>
-
-    <script>
-        let currentSessionId = null;
-        let ws = null;
-        const STAGE_DEFINITIONS = {stages_json};
-        const STAGE_GROUPS = {groups_json};
-        const STAGE_ORDER = {order_json};
-        const STAGE_DEPENDENCIES = {deps_json};
-        const stageResults = {{}};
-
-        document.addEventListener('DOMContentLoaded', function() {{
-            checkLLMConfig();
-            renderInitialPipeline();
-        }});
-
-        function checkLLMConfig() {{
-            const llmConfigured = {str(llm_configured).lower()};
-            if (!llmConfigured || llmConfigured === 'false') {{
-                document.getElementById('configWarning').style.display = 'flex';
-            }}
-        }}
-
-        function renderInitialPipeline() {{
-            const container = document.getElementById('pipelineContainer');
-            container.innerHTML = '';
-
-            for (const [groupId, group] of Object.entries(STAGE_GROUPS)) {{
-                const groupDiv = document.createElement('div');
-                groupDiv.className = 'stage-group';
-
-                // 分组标题
-                const header = document.createElement('div');
-                header.className = 'group-header';
-                header.innerHTML = `
-                    <span class="group-icon">${{group.icon}}</span>
-                    <span class="group-name">${{group.name}}</span>
-                `;
-                groupDiv.appendChild(header);
-
-                // 阶段列表
-                const stagesDiv = document.createElement('div');
-                stagesDiv.className = 'group-stages';
-
-                for (const stageId of group.stages) {{
-                    const stageDef = STAGE_DEFINITIONS[stageId];
-                    const row = createStageRow(stageId, stageDef);
-                    stagesDiv.appendChild(row);
-                }}
-
-                groupDiv.appendChild(stagesDiv);
-                container.appendChild(groupDiv);
-            }}
-        }}
-
-        function createStageRow(stageId, stageDef) {{
-            const row = document.createElement('div');
-            row.className = 'stage-row';
-            row.id = `stage-row-${{stageId}}`;
-
-            row.innerHTML = `
-                <div class="stage-info">
-                    <span class="stage-info-icon">${{stageDef.icon}}</span>
-                    <div class="stage-info-text">
-                        <div class="stage-info-sub">${{stageDef.sub_stage}}</div>
-                        <div class="stage-info-name">${{stageDef.short_name}}</div>
-                        <div class="stage-info-desc">${{stageDef.description}}</div>
-                    </div>
-                    <button class="stage-regenerate-btn" id="regenerate-${{stageId}}" onclick="regenerateStage('${{stageId}}')" disabled>
-                        🔄 重新生成
-                    </button>
-                    <div class="stage-status-indicator status-pending" id="status-${{stageId}}"></div>
-                </div>
-                <div class="stage-results" id="results-${{stageId}}">
-                    <div class="empty-state">等待中...</div>
-                </div>
-            `;
-
-            return row;
-        }}
-
-        async function startGeneration() {{
-            const text = document.getElementById('inputText').value.trim();
-            if (!text) {{
-                alert('请输入故事内容');
-                return;
-            }}
-
-            const btn = document.getElementById('generateBtn');
-            btn.disabled = true;
-            btn.textContent = '⏳ 生成中...';
-
-            try {{
-                const res = await fetch('/api/generate', {{
-                    method: 'POST',
-                    headers: {{ 'Content-Type': 'application/json' }},
-                    body: JSON.stringify({{
-                        text: text,
-                        style: document.getElementById('style').value,
-                        resolution: document.getElementById('resolution').value
-                    }})
-                }});
-
-                const data = await res.json();
-                if (data.error) {{
-                    alert('启动失败: ' + data.error);
-                    btn.disabled = false;
-                    btn.textContent = '🚀 开始生成';
-                    return;
-                }}
-
-                currentSessionId = data.session_id;
-                renderInitialPipeline();
-                document.getElementById('progressSection').classList.add('active');
-                document.getElementById('flowSection').classList.add('active');
-                connectWebSocket();
-
-            }} catch (e) {{
-                alert('请求失败: ' + e.message);
-                btn.disabled = false;
-                btn.textContent = '🚀 开始生成';
-            }}
-        }}
-
-        function connectWebSocket() {{
-            const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-            const wsUrl = `${{protocol}}//${{window.location.host}}/ws`;
-
-            ws = new WebSocket(wsUrl);
-
-            ws.onopen = () => {{
-                console.log('WebSocket connected');
-                if (currentSessionId) {{
-                    ws.send(JSON.stringify({{
-                        type: 'subscribe',
-                        session_id: currentSessionId
-                    }}));
-                }}
-            }};
-
-            ws.onmessage = (event) => {{
-                const data = JSON.parse(event.data);
-                handleWebSocketMessage(data);
-            }};
-
-            ws.onclose = () => {{
-                console.log('WebSocket disconnected');
-                setTimeout(() => {{
-                    if (currentSessionId) {{
-                        connectWebSocket();
-                    }}
-                }}, 5000);
-            }};
-
-            ws.onerror = (error) => {{
-                console.error('WebSocket error:', error);
-            }};
-        }}
-
-        function handleWebSocketMessage(data) {{
-            console.log('收到消息:', data);
-
-            if (data.type === 'stage_update') {{
-                updateStageStatus(data.stage_id, data.status);
-
-                if (data.status === 'success' && data.output) {{
-                    addResultCard(data.stage_id, data.output);
-                }}
-
-                // 更新进度
-                let completed = 0;
-                STAGE_ORDER.forEach(id => {{
-                    const resultsContainer = document.getElementById(`results-${{id}}`);
-                    if (resultsContainer && !resultsContainer.querySelector('.empty-state')) {{
-                        completed++;
-                    }}
-                }});
-                const progress = Math.min(completed / STAGE_ORDER.length, 1);
-                const stageDef = STAGE_DEFINITIONS[data.stage_id];
-                const isRegeneration = data.is_regeneration ? '重新' : '';
-                updateProgress(progress, `${{isRegeneration}}${{stageDef ? stageDef.short_name : '处理中'}}`);
-
-            }} else if (data.type === 'complete') {{
-                generationComplete(data.output_path);
-            }} else if (data.type === 'error') {{
-                generationError(data.error);
-            }}
-        }}
-
-        function updateStageStatus(stageId, status) {{
-            const indicator = document.getElementById(`status-${{stageId}}`);
-            if (indicator) {{
-                indicator.className = `stage-status-indicator status-${{status}}`;
-            }}
-
-            // 更新重新生成按钮状态
-            const regenerateBtn = document.getElementById(`regenerate-${{stageId}}`);
-            if (regenerateBtn) {{
-                // 检查依赖是否满足
-                const deps = STAGE_DEPENDENCIES[stageId] || [];
-                let canRegenerate = deps.every(depId => {{
-                    const depIndicator = document.getElementById(`status-${{depId}}`);
-                    return depIndicator && depIndicator.classList.contains('status-success');
-                }});
-
-                // 只对已实现的阶段允许重新生成
-                const implementedStages = ['1_0', '2_1', '2_2', '2_3'];
-                regenerateBtn.disabled = !canRegenerate || status === 'running' || !implementedStages.includes(stageId);
-            }}
-        }}
-
-        async function regenerateStage(stageId) {{
-            if (!currentSessionId) {{
-                alert('请先生成完整流程');
-                return;
-            }}
-
-            const regenerateBtn = document.getElementById(`regenerate-${{stageId}}`);
-            regenerateBtn.disabled = true;
-            regenerateBtn.textContent = '⏳ 生成中...';
-
-            updateStageStatus(stageId, 'running');
-
-            try {{
-                const res = await fetch('/api/regenerate_stage', {{
-                    method: 'POST',
-                    headers: {{ 'Content-Type': 'application/json' }},
-                    body: JSON.stringify({{
-                        session_id: currentSessionId,
-                        stage_id: stageId
-                    }})
-                }});
-
-                const data = await res.json();
-                if (data.error) {{
-                    alert('重新生成失败: ' + data.error);
-                    updateStageStatus(stageId, 'failed');
-                }}
-            }} catch (e) {{
-                alert('请求失败: ' + e.message);
-                updateStageStatus(stageId, 'failed');
-            }} finally {{
-                regenerateBtn.textContent = '🔄 重新生成';
-            }}
-        }}
-
-        function addResultCard(stageId, output) {{
-            const resultsContainer = document.getElementById(`results-${{stageId}}`);
-            if (!resultsContainer) return;
-
-            const emptyState = resultsContainer.querySelector('.empty-state');
-            if (emptyState) {{
-                emptyState.remove();
-            }}
-
-            if (!stageResults[stageId]) {{
-                stageResults[stageId] = [];
-            }}
-            const resultIndex = stageResults[stageId].length;
-            stageResults[stageId].push(output);
-
-            const card = createResultCard(stageId, output, resultIndex);
-            resultsContainer.appendChild(card);
-            resultsContainer.scrollLeft = resultsContainer.scrollWidth;
-        }}
-
-        function createResultCard(stageId, output, index) {{
-            const card = document.createElement('div');
-            card.className = 'result-card';
-
-            const now = new Date();
-            const timeStr = `${{now.getHours().toString().padStart(2, '0')}}:${{now.getMinutes().toString().padStart(2, '0')}}:${{now.getSeconds().toString().padStart(2, '0')}}`;
-
-            let content = '';
-
-            switch(stageId) {{
-                case '1_0':
-                    content = `
-                        <div class="result-text">
-                            <div><strong>输入文本:</strong> ${{output.input_text || ''}}</div>
-                            <div style="margin-top:8px;"><strong>风格:</strong> ${{output.style || 'anime'}}</div>
-                            <div><strong>分辨率:</strong> ${{output.resolution || '1080p'}}</div>
-                        </div>
-                    `;
-                    break;
-
-                case '2_1':
-                    content = `
-                        <div class="result-text">
-                            <div style="margin-bottom:8px;"><strong>标题:</strong> ${{output.title || '未命名'}}</div>
-                            <div style="margin-bottom:8px;"><strong>类型:</strong> ${{output.story_type || '未知'}}</div>
-                            <div style="margin-bottom:8px;"><strong>主题:</strong> ${{output.theme || '未知'}}</div>
-                            <div style="margin-bottom:12px;"><strong>场景数:</strong> ${{output.scene_count || 0}} | <strong>角色数:</strong> ${{output.character_count || 0}}</div>
-                        </div>
-                    `;
-                    if (output.scenes && output.scenes.length > 0) {{
-                        content += `<div class="scene-list">`;
-                        output.scenes.slice(0, 3).forEach(scene => {{
-                            content += `
-                                <div class="scene-item">
-                                    <div class="scene-title">场景 ${{scene.order + 1}}: ${{scene.title}}</div>
-                                    <div class="scene-desc">${{(scene.description || '').substring(0, 80)}}...</div>
-                                </div>
-                            `;
-                        }});
-                        if (output.scenes.length > 3) {{
-                            content += `<div style="text-align:center;color:#94a3b8;font-size:12px;padding:8px;">...还有 ${{output.scenes.length - 3}} 个场景</div>`;
-                        }}
-                        content += `</div>`;
-                    }}
-                    break;
-
-                case '2_2':
-                    content = `
-                        <div class="result-text">
-                            <div><strong>已准备场景描述:</strong> ${{output.description_count || 0}} 个场景</div>
-                        </div>
-                    `;
-                    break;
-
-                case '2_3':
-                    if (output.image_paths && output.image_paths.length > 0) {{
-                        content = `<div class="image-grid">`;
-                        output.image_paths.slice(0, 4).forEach((path, idx) => {{
-                            const fileName = path.split(/[\\/]/).pop();
-                            const imageUrl = '/temp/' + fileName;
-                            content += `
-                                <div class="image-item">
-                                    <img src="${{imageUrl}}" alt="场景 ${{idx + 1}}" onerror="this.parentElement.innerHTML='<div style=\\'display:flex;align-items:center;justify-content:center;height:100%;color:#ef4444;font-size:11px;\\'>加载失败</div>'">
-                                </div>
-                            `;
-                        }});
-                        if (output.image_paths.length > 4) {{
-                            content += `<div style="grid-column:1/-1;text-align:center;color:#94a3b8;font-size:12px;padding:8px;">...还有 ${{output.image_paths.length - 4}} 张图像</div>`;
-                        }}
-                        content += `</div>`;
-                    }} else {{
-                        content = `<div class="result-text">无图像生成</div>`;
-                    }}
-                    break;
-
-                default:
-                    content = `<div class="result-text">该阶段尚未实现</div>`;
-                    break;
-            }}
-
-            card.innerHTML = `
-                <div class="result-header">
-                    <span class="result-title">#${{index + 1}}</span>
-                    <span class="result-time">${{timeStr}}</span>
-                </div>
-                <div class="result-content">
-                    ${{content}}
-                </div>
-            `;
-
-            return card;
-        }}
-
-        function updateProgress(progress, message) {{
-            const progressBar = document.getElementById('progressBar');
-            const progressText = document.getElementById('progressText');
-
-            progressBar.style.width = `${{progress * 100}}%`;
-            progressText.textContent = `${{message}} (${{Math.round(progress * 100)}}%)`;
-        }}
-
-        function generationComplete(outputPath) {{
-            const btn = document.getElementById('generateBtn');
-            btn.disabled = false;
-            btn.textContent = '🚀 开始生成';
-            updateProgress(1, '生成完成！');
-        }}
-
-        function generationError(error) {{
-            const btn = document.getElementById('generateBtn');
-            btn.disabled = false;
-            btn.textContent = '🚀 开始生成';
-            alert('生成失败: ' + error);
-        }}
-    </script>
-</body>
-</html>
+    会话结束后响应内容不再变化，冻结序列化结果并附带强ETag，
+    客户端携带 If-None-Match 重复请求时返回304
     """
-
-
-@app.get("/api/config/check")
-async def check_config():
-    """检查配置状态"""
-    return {
-        "llm_configured": bool(config.api.llm_api_key),
-        "llm_provider": config.api.llm_provider,
-        "llm_model": config.api.llm_model
-    }
-
-
-@app.post("/api/generate")
-async def start_generation(request: GenerateRequest):
-    """开始生成"""
-    session = create_session(request.text, request.style, request.resolution)
-    asyncio.create_task(run_generation_task(session.id))
-    return {
-        "session_id": session.id,
-        "stages": STAGE_DEFINITIONS
-    }
-
-
-@app.post("/api/regenerate_stage")
-async def regenerate_stage_api(request: RegenerateRequest, background_tasks: BackgroundTasks):
-    """重新生成指定阶段"""
-    session = get_session(request.session_id)
+    session = get_session(session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    background_tasks.add_task(run_stage_regeneration, request.session_id, request.stage_id)
+    if session._frozen_response is None:
+        body = _dumps(_session_detail(session))
+        if not session.is_terminal():
+            return Response(content=body, media_type="application/json")
+        session._frozen_response = body
+        session._etag = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
 
-    return {
-        "success": True,
-        "message": f"开始重新生成阶段: {request.stage_id}"
-    }
+    headers = {"ETag": session._etag}
+    if _etag_matches(request, session._etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=session._frozen_response, media_type="application/json", headers=headers)
 
 
-@app.get("/api/sessions")
-async def list_sessions_api():
-    """列出所有生成会话"""
-    sessions = list_sessions()
-    return {
-        "sessions": [
-            {
-                "id": s.id,
-                "input": s.input_text[:100],
-                "style": s.style,
-                "resolution": s.resolution,
-                "create_time": s.create_time.isoformat(),
-                "progress": s.get_progress(),
-            }
-            for s in sessions
-        ]
-    }
+def _session_init_snapshot(session: GenerationSession) -> bytes:
+    """序列化好的 session_init 消息
 
-
-@app.get("/api/sessions/{session_id}")
-async def get_session_api(session_id: str):
-    """获取生成会话详情"""
-    session = get_session(session_id)
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
-
-    return {
-        "id": session.id,
-        "input": session.input_text,
-        "style": session.style,
-        "resolution": session.resolution,
-        "create_time": session.create_time.isoformat(),
-        "progress": session.get_progress(),
-        "stages": {
-            stage_id: {
-                "id": node.id,
-                "stage_id": node.stage_id,
-                "stage_name": node.stage_name,
-                "status": node.status.value,
-                "start_time": node.start_time.isoformat() if node.start_time else None,
-                "end_time": node.end_time.isoformat() if node.end_time else None,
-                "duration": node.duration,
-                "error_message": node.error_message,
-                "output": node.output,
-                "progress": node.progress,
+    同一会话的订阅者共用一份，直到阶段状态变化（mark_session_changed）才重新生成
+    """
+    if session._init_snapshot is None:
+        # 阶段定义等固定字段直接拼接预先序列化的字节
+        dynamic = _dumps({
+            "type": "session_init",
+            "session_id": session.id,
+            "progress": session.get_progress(),
+            "nodes": {
+                stage_id: {
+                    "status": node.status.value,
+                    "output": node.output,
+                    "duration": node.duration,
+                    "error": node.error_message
+                }
+                for stage_id, node in session.nodes.items()
             }
-            for stage_id, node in session.nodes.items()
-        }
-    }
+        })
+        session._init_snapshot = dynamic[:-1] + b"," + _SESSION_INIT_STATIC_JSON + b"}"
+    return session._init_snapshot
 
 
 @app.websocket("/ws")
@@ -1963,42 +1573,34 @@ async def websocket_endpoint(websocket: WebSocket):
             data = await websocket.receive_json()
 
             if data.get("type") == "subscribe":
+                # 重新订阅时先退出之前的会话
+                if session_id:
+                    manager.disconnect(websocket, session_id)
                 session_id = data.get("session_id")
                 session = get_session(session_id)
 
                 if session:
-                    await manager.connect(websocket, session_id)
-
                     # 发送当前会话状态
-                    await websocket.send_json({
-                        "type": "session_init",
-                        "session_id": session.id,
-                        "stages": STAGE_DEFINITIONS,
-                        "groups": STAGE_GROUPS,
-                        "order": STAGE_ORDER,
-                        "progress": session.get_progress(),
-                        "nodes": {
-                            stage_id: {
-                                "status": node.status.value,
-                                "output": node.output,
-                                "duration": node.duration,
-                                "error": node.error_message
-                            }
-                            for stage_id, node in session.nodes.items()
-                        }
-                    })
+                    await manager.connect(websocket, session_id, snapshot=_session_init_snapshot(session))
 
     except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.warning("WebSocket error: %s", e)
+    finally:
         if session_id:
             manager.disconnect(websocket, session_id)
-    except Exception as e:
-        print(f"WebSocket error: {e}")
 
 
-if __name__ == "__main__":
-    import uvicorn
+# 主页只依赖启动时确定的阶段定义和配置：导入时渲染一次并计算ETag
+_INDEX_HTML = _render_index().encode("utf-8")
+_INDEX_ETAG = f'"{hashlib.blake2b(_INDEX_HTML, digest_size=8).hexdigest()}"'
+# 压缩版本只在导入时压缩一次；不同编码的表示使用不同的强ETag
+_INDEX_HTML_GZ = gzip.compress(_INDEX_HTML, compresslevel=9)
+_INDEX_ETAG_GZ = _INDEX_ETAG[:-1] + '-gz"'
 
 
 if __name__ == "__main__":
     import uvicorn
+    logging.basicConfig(level=logging.INFO)
     uvicorn.run("app.web:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,103 @@
+"""web 模块生成任务收尾逻辑的测试"""
+import asyncio
+
+import pytest
+
+import app.web as web
+from app.models import GenerationResult
+from app.web import StageStatus
+
+
+class FakeGenerator:
+    """按给定顺序上报阶段进度，然后返回预设结果（设置了 error 时抛出该异常）的生成器"""
+
+    error = None
+
+    def __init__(self, cfg=None):
+        self._progress_callback = None
+        self._error_callback = None
+
+    def generate(self, text, style=None, resolution=None):
+        for stage_name, progress in self.stages:
+            self._progress_callback(stage_name, progress)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+@pytest.fixture
+def fake_generator(monkeypatch):
+    # 每个测试使用新的子类，设置的进度和结果不会带到其它测试
+    generator_class = type("TestGenerator", (FakeGenerator,), {})
+    monkeypatch.setattr(web, "Generator", generator_class)
+    monkeypatch.setattr(web, "_idle_generators", [])
+    return generator_class
+
+
+def _run(session):
+    asyncio.run(web.run_generation_task(session.id))
+    return {stage_id: (node.status, node.error_message) for stage_id, node in session.nodes.items()}
+
+
+def test_failed_result_blames_current_stage(fake_generator):
+    """生成器返回失败时，错误记在最后开始的阶段上"""
+    fake_generator.stages = [("输入处理", 0.2), ("剧本生成", 0.4), ("场景描述生成", 0.6)]
+    fake_generator.result = GenerationResult(success=False, error_message="scene failed")
+    session = web.create_session("text")
+
+    statuses = _run(session)
+
+    assert statuses["1_0"] == (StageStatus.SUCCESS, None)
+    assert statuses["2_1"] == (StageStatus.FAILED, "生成中断")
+    assert statuses["2_2"] == (StageStatus.FAILED, "scene failed")
+    assert statuses["2_3"][0] == StageStatus.SKIPPED
+    assert statuses["2_4"][0] == StageStatus.SKIPPED
+    assert session.is_terminal()
+    assert session._relay is None
+
+
+def test_raised_error_follows_same_rule(fake_generator):
+    """生成抛出异常时与返回失败结果按同一规则收尾"""
+    fake_generator.stages = [("输入处理", 0.2), ("剧本生成", 0.4), ("场景描述生成", 0.6)]
+    fake_generator.error = RuntimeError("boom")
+    session = web.create_session("text")
+
+    statuses = _run(session)
+
+    assert statuses["1_0"] == (StageStatus.SUCCESS, None)
+    assert statuses["2_1"] == (StageStatus.FAILED, "生成中断")
+    assert statuses["2_2"] == (StageStatus.FAILED, "boom")
+    assert statuses["2_3"][0] == StageStatus.SKIPPED
+    assert session.is_terminal()
+
+
+def test_success_without_output_downgrades_stage(fake_generator):
+    """生成成功但缺少某阶段产出时，提前标记为成功的该阶段降级为失败"""
+    fake_generator.stages = [
+        ("输入处理", 0.2), ("剧本生成", 0.4), ("场景描述生成", 0.6), ("图像生成", 0.8), ("音频生成", 1.0)
+    ]
+    fake_generator.result = GenerationResult(success=True)
+    session = web.create_session("text")
+
+    statuses = _run(session)
+
+    assert statuses["1_0"] == (StageStatus.SUCCESS, None)
+    assert statuses["2_1"] == (StageStatus.FAILED, "未生成该阶段结果")
+    assert statuses["2_2"] == (StageStatus.SUCCESS, None)
+    assert statuses["2_3"] == (StageStatus.FAILED, "未生成该阶段结果")
+    assert statuses["2_4"] == (StageStatus.FAILED, "未生成该阶段结果")
+
+
+@pytest.mark.parametrize("error", [None, RuntimeError("boom")])
+def test_failure_leaves_other_runs_stage_alone(fake_generator, error):
+    """失败收尾不改动其它任务（重新生成）正在运行的阶段"""
+    fake_generator.stages = [("输入处理", 0.2), ("剧本生成", 0.4)]
+    fake_generator.result = GenerationResult(success=False, error_message="script failed")
+    fake_generator.error = error
+    session = web.create_session("text")
+    session.get_node("2_3").status = StageStatus.RUNNING
+
+    statuses = _run(session)
+
+    assert statuses["2_1"][0] == StageStatus.FAILED
+    assert statuses["2_3"] == (StageStatus.RUNNING, None)